@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+import maya.api.OpenMayaAnim as oma
+
+from GZ_utils import deformUtils as dfu
+from GZ_utils import skinFileUtils as sfu
+from GZ_utils import skinStoreUtils as sst
+
+def maya_useNewAPI():
+    '''
+    Tell Maya this plugin uses the Python API 2.0
+    '''
+    pass
+
+def getArray(dataBlock, attribute, dtype):
+    '''Return an int or double array attribute value as a numpy array.'''
+    data = dataBlock.inputValue(attribute).data()
+    if data.isNull():
+        return np.zeros(0, dtype=dtype)
+    if dtype == np.float64:
+        return np.array(om.MFnDoubleArrayData(data).array(), dtype=dtype)
+    return np.array(om.MFnIntArrayData(data).array(), dtype=dtype)
+
+def getMatrices(dataBlock, attribute, count):
+    '''Return the first count matrices of a matrix array attribute as a (count, 4, 4) array, identity if missing.'''
+    matrices = np.tile(np.eye(4), (count, 1, 1))
+    arrayHandle = dataBlock.inputArrayValue(attribute)
+    for i in range(len(arrayHandle)):
+        arrayHandle.jumpToPhysicalElement(i)
+        index = arrayHandle.elementLogicalIndex()
+        if index < count:
+            matrix = arrayHandle.inputValue().asMatrix()
+            matrices[index] = [ [ matrix.getElement(r, c) for c in range(4) ] for r in range(4) ]
+    return matrices
+
+class CsrSkinNode(oma.MPxDeformerNode):
+    '''
+    Linear blend skinning of the whole geometry at once with numpy, from sparse (CSR) weights.
+    Weights come from the skin file of weightFile (".swb", ".swc" or ".sw"), or else from the csrVertices,
+    csrOffsets, csrIndices and csrWeights arrays. matrix[i] and bindPreMatrix[i] belong to the influence i of the weights.
+    The weights are not normalized, they are used as they are.
+    '''
+
+    TYPE_NAME = "gzCsrSkin"
+    TYPE_ID = om.MTypeId(0x0007F7F8)
+
+    weightFile = None
+    csrVertices = None
+    csrOffsets = None
+    csrIndices = None
+    csrWeights = None
+    matrix = None
+    bindPreMatrix = None
+
+    def __init__(self):
+        super(CsrSkinNode, self).__init__()
+        self.skinData = None
+        self.layout = None
+        self.fileKey = None
+
+    def setDependentsDirty(self, plug, plugArray):
+        if plug.attribute() in (CsrSkinNode.weightFile, CsrSkinNode.csrVertices, CsrSkinNode.csrOffsets,
+                                CsrSkinNode.csrIndices, CsrSkinNode.csrWeights):
+            self.skinData = None
+
+    def getSkinData(self, dataBlock):
+        '''Return the SkinData of the node, read again only when the weights changed.'''
+        filePath = dataBlock.inputValue(CsrSkinNode.weightFile).asString()
+        fileKey = (filePath, os.path.getmtime(filePath)) if filePath and os.path.isfile(filePath) else None
+        if self.skinData is not None and fileKey == self.fileKey:
+            return self.skinData
+
+        if fileKey:
+            data = sst.readSkinFile(filePath)
+        else:
+            vertices = getArray(dataBlock, CsrSkinNode.csrVertices, np.uint32)
+            offsets = getArray(dataBlock, CsrSkinNode.csrOffsets, np.uint32)
+            indices = getArray(dataBlock, CsrSkinNode.csrIndices, np.uint16)
+            values = getArray(dataBlock, CsrSkinNode.csrWeights, np.float64)
+            if not len(offsets) or len(offsets) != len(vertices) + 1 or len(indices) != len(values):
+                return None
+            numInfluence = int(indices.max()) + 1 if len(indices) else 0
+            data = sfu.SkinData('', [ str(i) for i in range(numInfluence) ], vertices, offsets, indices, values,
+                                int(vertices.max()) + 1 if len(vertices) else 0, b'')
+
+        self.skinData, self.fileKey = data, fileKey
+        self.layout = dfu.skinningLayout(data)
+        return data
+
+    def deform(self, dataBlock, geomIter, localToWorld, multiIndex):
+        envelope = dataBlock.inputValue(oma.MPxDeformerNode.envelope).asFloat()
+        data = self.getSkinData(dataBlock)
+        if envelope == 0.0 or data is None:
+            return
+
+        points = np.array(geomIter.allPositions(), dtype=np.float64).reshape(-1, 4)
+        if len(data.vertices) and int(data.vertices.max()) >= len(points):
+            return
+
+        # skin in world space, as a skinCluster does
+        toWorld = np.array([ [ localToWorld.getElement(r, c) for c in range(4) ] for r in range(4) ])
+        matrices = np.matmul(getMatrices(dataBlock, CsrSkinNode.bindPreMatrix, len(data.influences)),
+                             getMatrices(dataBlock, CsrSkinNode.matrix, len(data.influences)))
+        world = np.dot(points, toWorld)[:, :3]
+        skinned = dfu.linearBlendSkinning(world, data, matrices[None], layout=self.layout)[0]
+        skinned = np.dot(np.concatenate([skinned, np.ones((len(skinned), 1))], axis=1), np.linalg.inv(toWorld))
+
+        points[:, :3] += envelope * (skinned[:, :3] - points[:, :3])
+        geomIter.setAllPositions(om.MPointArray(points.tolist()))
+
+    @classmethod
+    def creator(cls):
+        return CsrSkinNode()
+
+    @classmethod
+    def initialize(cls):
+        fnTyped = om.MFnTypedAttribute()
+        cls.weightFile = fnTyped.create("weightFile", "wf", om.MFnData.kString)
+        cls.csrVertices = fnTyped.create("csrVertices", "csv", om.MFnData.kIntArray)
+        cls.csrOffsets = fnTyped.create("csrOffsets", "cso", om.MFnData.kIntArray)
+        cls.csrIndices = fnTyped.create("csrIndices", "csi", om.MFnData.kIntArray)
+        cls.csrWeights = fnTyped.create("csrWeights", "csw", om.MFnData.kDoubleArray)
+
+        fnMatrix = om.MFnMatrixAttribute()
+        cls.matrix = fnMatrix.create("matrix", "ma")
+        fnMatrix.array = True
+        cls.bindPreMatrix = fnMatrix.create("bindPreMatrix", "pm")
+        fnMatrix.array = True
+
+        outputGeom = oma.MPxDeformerNode.outputGeom
+        for attribute in (cls.weightFile, cls.csrVertices, cls.csrOffsets, cls.csrIndices, cls.csrWeights,
+                          cls.matrix, cls.bindPreMatrix):
+            cls.addAttribute(attribute)
+            cls.attributeAffects(attribute, outputGeom)
+
+
+def initializePlugin(plugin):
+
+    vendor = "Afip Hidayatulloh"
+    version = "1.0.0"
+
+    plugin_fn = om.MFnPlugin(plugin, vendor, version)
+    try:
+        plugin_fn.registerNode(CsrSkinNode.TYPE_NAME,
+                               CsrSkinNode.TYPE_ID,
+                               CsrSkinNode.creator,
+                               CsrSkinNode.initialize,
+                               om.MPxNode.kDeformerNode)
+    except:
+        om.MGlobal.displayError("Failed to register node: {0}".format(CsrSkinNode.TYPE_NAME))
+
+def uninitializePlugin(plugin):
+    '''
+    '''
+    plugin_fn = om.MFnPlugin(plugin)
+    try:
+        plugin_fn.deregisterNode(CsrSkinNode.TYPE_ID)
+    except:
+        om.MGlobal.displayError("Failed to deregister node: {0}".format(CsrSkinNode.TYPE_NAME))
+
+if __name__ == "__main__":
+    '''
+    For development test only, delete this when publish
+    '''
+    # create new file, because we cannot unload the plugin if we still have a node in the scene
+    cmds.file(new=True, force=True)
+
+    # It's for unload and load back the plugin
+    plugin_name = "csr_skin_deformer.py" # rename this with the script file name
+    cmds.evalDeferred('if cmds.pluginInfo("{0}", q=True, loaded=True): cmds.unloadPlugin("{0}")'.format(plugin_name))
+    cmds.evalDeferred('if not cmds.pluginInfo("{0}", q=True, loaded=True): cmds.loadPlugin("{0}")'.format(plugin_name))
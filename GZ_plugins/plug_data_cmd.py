@@ -0,0 +1,75 @@
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+
+def maya_useNewAPI():
+    '''
+    Tell Maya this plugin uses the Python API 2.0
+    '''
+    pass
+
+class SetPlugDataCmd(om.MPxCommand):
+    '''
+    Set the data objects (point, component list, array data...) staged by GZ_utils.meshUtils.setPlugData on their
+    plugs through one MDGModifier, so the whole write is a single undo step.
+    '''
+
+    COMMAND_NAME = "gzSetPlugData"
+
+    def __init__(self):
+        super(SetPlugDataCmd, self).__init__()
+        self.modifier = None
+
+    def doIt(self, args):
+        from GZ_utils import meshUtils
+
+        values = meshUtils.PENDING_PLUG_DATA.pop('plugs', None)
+        if values is None:
+            raise RuntimeError("{0}: no plug data staged.".format(self.COMMAND_NAME))
+        self.modifier = om.MDGModifier()
+        for plug, data in values:
+            self.modifier.newPlugValue(plug, data)
+        self.redoIt()
+
+    def redoIt(self):
+        self.modifier.doIt()
+
+    def undoIt(self):
+        self.modifier.undoIt()
+
+    def isUndoable(self):
+        return True
+
+    @classmethod
+    def creator(cls):
+        return SetPlugDataCmd()
+
+
+def initializePlugin(plugin):
+
+    vendor = "Afip Hidayatulloh"
+    version = "1.0.0"
+
+    plugin_fn = om.MFnPlugin(plugin, vendor, version)
+
+    try:
+        plugin_fn.registerCommand(SetPlugDataCmd.COMMAND_NAME, SetPlugDataCmd.creator)
+    except:
+        om.MGlobal.displayError("Failed to register command: {0}".format(SetPlugDataCmd))
+
+def uninitializePlugin(plugin):
+    '''
+    '''
+    plugin_fn = om.MFnPlugin(plugin)
+    try:
+        plugin_fn.deregisterCommand(SetPlugDataCmd.COMMAND_NAME)
+    except:
+        om.MGlobal.displayError("Failed to deregister command: {0}".format(SetPlugDataCmd))
+
+if __name__ == "__main__":
+    '''
+    For development test only, delete this when publish
+    '''
+    # It's for unload and load back the plugin
+    plugin_name = "plug_data_cmd.py" # rename this with the script file name
+    cmds.evalDeferred('if cmds.pluginInfo("{0}", q=True, loaded=True): cmds.unloadPlugin("{0}")'.format(plugin_name))
+    cmds.evalDeferred('if not cmds.pluginInfo("{0}", q=True, loaded=True): cmds.loadPlugin("{0}")'.format(plugin_name))
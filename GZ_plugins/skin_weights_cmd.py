@@ -0,0 +1,75 @@
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+
+def maya_useNewAPI():
+    '''
+    Tell Maya this plugin uses the Python API 2.0
+    '''
+    pass
+
+class SetSkinWeightsCmd(om.MPxCommand):
+    '''
+    Apply the weights staged by GZ_utils.skinUtils.setSkinWeights with one MFnSkinCluster.setWeights call.
+    The old weights are kept so the whole write is a single undo step.
+    '''
+
+    COMMAND_NAME = "gzSetSkinWeights"
+
+    def __init__(self):
+        super(SetSkinWeightsCmd, self).__init__()
+        self.data = None
+        self.oldWeights = None
+
+    def doIt(self, args):
+        from GZ_utils import skinUtils
+
+        self.data = skinUtils.PENDING_WEIGHTS.pop('weights', None)
+        if self.data is None:
+            raise RuntimeError("{0}: no weights staged.".format(self.COMMAND_NAME))
+        self.redoIt()
+
+    def redoIt(self):
+        fnSkin, shapePath, component, influences, weights = self.data
+        self.oldWeights = fnSkin.setWeights(shapePath, component, influences, weights, False, True)
+
+    def undoIt(self):
+        fnSkin, shapePath, component, influences, weights = self.data
+        fnSkin.setWeights(shapePath, component, influences, self.oldWeights, False)
+
+    def isUndoable(self):
+        return True
+
+    @classmethod
+    def creator(cls):
+        return SetSkinWeightsCmd()
+
+
+def initializePlugin(plugin):
+
+    vendor = "Afip Hidayatulloh"
+    version = "1.0.0"
+
+    plugin_fn = om.MFnPlugin(plugin, vendor, version)
+
+    try:
+        plugin_fn.registerCommand(SetSkinWeightsCmd.COMMAND_NAME, SetSkinWeightsCmd.creator)
+    except:
+        om.MGlobal.displayError("Failed to register command: {0}".format(SetSkinWeightsCmd))
+
+def uninitializePlugin(plugin):
+    '''
+    '''
+    plugin_fn = om.MFnPlugin(plugin)
+    try:
+        plugin_fn.deregisterCommand(SetSkinWeightsCmd.COMMAND_NAME)
+    except:
+        om.MGlobal.displayError("Failed to deregister command: {0}".format(SetSkinWeightsCmd))
+
+if __name__ == "__main__":
+    '''
+    For development test only, delete this when publish
+    '''
+    # It's for unload and load back the plugin
+    plugin_name = "skin_weights_cmd.py" # rename this with the script file name
+    cmds.evalDeferred('if cmds.pluginInfo("{0}", q=True, loaded=True): cmds.unloadPlugin("{0}")'.format(plugin_name))
+    cmds.evalDeferred('if not cmds.pluginInfo("{0}", q=True, loaded=True): cmds.loadPlugin("{0}")'.format(plugin_name))
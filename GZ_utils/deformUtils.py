@@ -0,0 +1,191 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+
+if __name__ == '__main__':
+    # run as a script (python GZ_utils/deformUtils.py) the repository root is not on the path yet
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from GZ_utils import skinStoreUtils as sst
+
+# Matrices follow Maya: row vectors, p' = p * M, translation on the last row. Arrays of matrices are (..., 4, 4).
+# Skinning matrices are bindPreMatrix * worldMatrix of every influence, bindPreMatrix being the inverse of the
+# influence world matrix at bind time.
+POSE_CHUNK = 16
+EVAL_TOLERANCE = 1e-3
+
+def skinningMatrices(bindMatrices, poseMatrices):
+    '''Return the skinning matrices (pose, influence, 4, 4) from influence world matrices at bind time
+    (influence, 4, 4) and per pose (pose, influence, 4, 4).
+    '''
+    return np.einsum('jab,pjbc->pjac', np.linalg.inv(bindMatrices), poseMatrices)
+
+def _sparseRows(data):
+    '''Return the row of every CSR entry of a SkinData.'''
+    return np.repeat(np.arange(len(data.vertices)), np.diff(data.offsets.astype(np.int64)))
+
+def _columns(data, influences):
+    '''Return the influence ids, in the influences order, of every CSR entry of a SkinData.'''
+    if influences is None:
+        return data.indices.astype(np.int64)
+    column = dict([ (inf, x) for x, inf in enumerate(influences) ])
+    missing = [ inf for inf in data.influences if inf not in column ]
+    if missing:
+        raise ValueError('{} missing from the influences.'.format(', '.join(missing)))
+    return np.array([ column[inf] for inf in data.influences ], dtype=np.int64)[data.indices.astype(np.int64)]
+
+def _entryGroups(data, columns):
+    '''Group the CSR entries of a SkinData by (slot in their row, influence): within a group every row appears
+    once, so a group adds into its rows with plain fancy indexing. Return (order, groups), groups being
+    (start, end, influence) over order.
+    '''
+    rows = _sparseRows(data)
+    slots = np.arange(len(rows)) - data.offsets.astype(np.int64)[rows]
+    order = np.lexsort((columns, slots))
+    keys = slots[order] * (int(columns.max()) + 1 if len(columns) else 1) + columns[order]
+    bounds = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True]) if len(order) else np.zeros(1, np.int64)
+    return order, [ (start, end, columns[order[start]]) for start, end in zip(bounds[:-1], bounds[1:]) ]
+
+def skinningLayout(data, influences=None):
+    '''Return what linearBlendSkinning needs from a SkinData only, to be computed once for many evaluations.'''
+    columns = _columns(data, influences)
+    order, groups = _entryGroups(data, columns)
+    return dict(vertices=data.vertices.astype(np.int64), rows=_sparseRows(data)[order], groups=groups,
+                values=data.values.astype(np.float64)[order, None],
+                empty=np.diff(data.offsets.astype(np.int64)) == 0)
+
+def linearBlendSkinning(restPoints, data, matrices, influences=None, chunk=POSE_CHUNK, layout=None):
+    '''Deform restPoints (vertex, 3) by the skinning matrices (pose, influence, 4, 4) with the sparse weights of a
+    SkinData. influences names the matrices, by default they follow the SkinData influences.
+    layout is the skinningLayout of data, computed when not given.
+    Only the rows of data.vertices are deformed, the others keep their rest position. Return (pose, vertex, 3).
+    '''
+    restPoints = np.asarray(restPoints, dtype=np.float64)
+    matrices = np.asarray(matrices, dtype=np.float64)
+    layout = layout or skinningLayout(data, influences)
+    vertices, rows, groups, empty = layout['vertices'], layout['rows'], layout['groups'], layout['empty']
+    homogeneous = np.concatenate([restPoints[vertices], np.ones((len(vertices), 1))], axis=1)[rows] * \
+                  layout['values']
+
+    result = np.repeat(restPoints[None], len(matrices), axis=0)
+    for first in range(0, len(matrices), chunk):
+        # (4, pose * 3) matrices so every group is a single matrix product
+        poseMatrices = matrices[first:first + chunk, :, :, :3].transpose(1, 2, 0, 3).reshape(matrices.shape[1], 4, -1)
+        skinned = np.zeros((len(vertices), poseMatrices.shape[-1]))
+        for start, end, influence in groups:
+            skinned[rows[start:end]] += np.dot(homogeneous[start:end], poseMatrices[influence])
+        skinned = skinned.reshape(len(vertices), -1, 3)
+        skinned[empty] = restPoints[vertices[empty], None]
+        result[first:first + chunk, vertices] = skinned.swapaxes(0, 1)
+    return result
+
+def _quaternionMultiply(a, b):
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack([aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw], axis=-1)
+
+def matrixToDualQuaternion(matrices):
+    '''Return the unit dual quaternions (..., 2, 4), (w, x, y, z) real then dual part, of rigid matrices.
+    Scale and shear are dropped.
+    '''
+    matrices = np.asarray(matrices, dtype=np.float64)
+    rotation = np.swapaxes(matrices[..., :3, :3], -1, -2)
+    rotation = rotation / np.linalg.norm(rotation, axis=-2, keepdims=True)
+    r = [ [ rotation[..., i, j] for j in range(3) ] for i in range(3) ]
+
+    # the quaternion is the main eigenvector of the symmetric matrix of Bar-Itzhack
+    k = np.stack([np.stack([r[0][0] + r[1][1] + r[2][2], r[2][1] - r[1][2], r[0][2] - r[2][0], r[1][0] - r[0][1]], -1),
+                  np.stack([r[2][1] - r[1][2], r[0][0] - r[1][1] - r[2][2], r[1][0] + r[0][1], r[2][0] + r[0][2]], -1),
+                  np.stack([r[0][2] - r[2][0], r[1][0] + r[0][1], r[1][1] - r[0][0] - r[2][2], r[2][1] + r[1][2]], -1),
+                  np.stack([r[1][0] - r[0][1], r[2][0] + r[0][2], r[2][1] + r[1][2], r[2][2] - r[0][0] - r[1][1]], -1)],
+                 -2) / 3.0
+    real = np.linalg.eigh(k)[1][..., -1]
+
+    translation = np.concatenate([np.zeros(matrices.shape[:-2] + (1,)), matrices[..., 3, :3]], axis=-1)
+    dual = 0.5 * _quaternionMultiply(translation, real)
+    return np.stack([real, dual], axis=-2)
+
+def dualQuaternionSkinning(restPoints, data, matrices, influences=None, chunk=POSE_CHUNK):
+    '''Same as linearBlendSkinning with dual quaternion blending, which keeps the volume of twisted joints.'''
+    restPoints = np.asarray(restPoints, dtype=np.float64)
+    rows, columns = _sparseRows(data), _columns(data, influences)
+    vertices = data.vertices.astype(np.int64)
+    order, groups = _entryGroups(data, columns)
+    firstColumns = columns[np.minimum(data.offsets[:-1].astype(np.int64), max(len(columns) - 1, 0))]
+    rows, weights = rows[order], data.values.astype(np.float64)[order]
+    empty = np.diff(data.offsets.astype(np.int64)) == 0
+    points = restPoints[vertices][:, None]
+
+    result = np.repeat(restPoints[None], len(matrices), axis=0)
+    quaternions = np.ascontiguousarray(matrixToDualQuaternion(matrices).swapaxes(0, 1).reshape(-1, len(matrices), 8))
+    for first in range(0, len(matrices), chunk):
+        poseQuaternions = quaternions[:, first:first + chunk]
+        blended = np.zeros((len(vertices),) + poseQuaternions.shape[1:])
+        for start, end, influence in groups:
+            groupRows = rows[start:end]
+            # flip quaternions to the hemisphere of the first influence of their vertex before blending
+            pivot = poseQuaternions[firstColumns[groupRows], :, :4]
+            sign = np.where((pivot * poseQuaternions[influence, :, :4]).sum(axis=-1) < 0, -1.0, 1.0)
+            blended[groupRows] += (weights[start:end, None] * sign)[..., None] * poseQuaternions[influence]
+        blended[empty] = [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        blended /= np.linalg.norm(blended[..., :4], axis=-1, keepdims=True)
+
+        real, dual = blended[..., :4], blended[..., 4:]
+        w, axis = real[..., :1], real[..., 1:]
+        rotated = points + 2.0 * np.cross(axis, np.cross(axis, points) + w * points)
+        conjugate = real * [1.0, -1.0, -1.0, -1.0]
+        translation = 2.0 * _quaternionMultiply(dual, conjugate)[..., 1:]
+        result[first:first + chunk, vertices] = (rotated + translation).swapaxes(0, 1)
+    return result
+
+def compareToReference(points, reference, tolerance=EVAL_TOLERANCE):
+    '''Compare deformed points (pose, vertex, 3) to a reference cache of the same shape.
+    Return a dict of the distance error per pose ('maxError', 'meanError'), the failing poses and the worst vertex
+    of every pose.
+    '''
+    points, reference = np.asarray(points), np.asarray(reference)
+    if points.shape != reference.shape:
+        raise ValueError('Point shapes differ: {} and {}.'.format(points.shape, reference.shape))
+    error = np.linalg.norm(points - reference, axis=-1)
+    maxError = error.max(axis=1) if error.size else np.zeros(len(error))
+    return dict(maxError=maxError, meanError=error.mean(axis=1) if error.size else maxError,
+                worstVertex=error.argmax(axis=1) if error.size else np.zeros(len(error), dtype=np.int64),
+                failed=np.flatnonzero(maxError > tolerance))
+
+def evaluateSkinFile(skinFile, rigFile, dualQuaternion=False):
+    '''Deform the rest points of a rig ".npz" with a skin file. Return (points, rig).
+    The rig holds restPoints (vertex, 3), influences names, bindMatrices (influence, 4, 4), poseMatrices
+    (pose, influence, 4, 4) and optionally reference points (pose, vertex, 3). Any skin file format is read.
+    '''
+    rig = np.load(rigFile)
+    matrices = skinningMatrices(rig['bindMatrices'], rig['poseMatrices'])
+    skinning = dualQuaternionSkinning if dualQuaternion else linearBlendSkinning
+    data = sst.readSkinFile(skinFile)
+    return skinning(rig['restPoints'], data, matrices, [ str(inf) for inf in rig['influences'] ]), rig
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deform rig poses with skin files and compare to reference points.')
+    parser.add_argument('rigFile', help='".npz" with restPoints, influences, bindMatrices, poseMatrices and '
+                                        'optionally reference')
+    parser.add_argument('skinFiles', nargs='+')
+    parser.add_argument('--dq', action='store_true', help='dual quaternion skinning')
+    parser.add_argument('--tolerance', type=float, default=EVAL_TOLERANCE)
+    args = parser.parse_args()
+
+    failed = 0
+    for skinFile in args.skinFiles:
+        points, rig = evaluateSkinFile(skinFile, args.rigFile, args.dq)
+        if 'reference' not in rig.files:
+            print('{}: {} poses of {} vertices evaluated, no reference points to compare.'.format(
+                skinFile, len(points), points.shape[1]))
+            continue
+        report = compareToReference(points, rig['reference'], args.tolerance)
+        failed += len(report['failed']) > 0
+        print('{}: {} poses, max error {:.6f}, {} poses over {}'.format(
+            skinFile, len(points), float(report['maxError'].max()), len(report['failed']), args.tolerance))
+    raise SystemExit(1 if failed else 0)
@@ -1,4 +1,17 @@
-from maya import cmds
+import os
+
+import numpy as np
+from maya import cmds, mel
+from maya.api import OpenMaya as om
+
+from GZ_utils import spatialUtils as spu
+from GZ_utils import targetLibUtils as tlu
+from GZ_utils import wrapUtils as wru
+from GZ_utils.progressUtils import ProgressReporter
+
+PLUG_DATA_PLUGIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'GZ_plugins', 'plug_data_cmd.py')
+PENDING_PLUG_DATA = dict()
 
 bshp= 'eyelid_MSH_blendShape'
 source, target = 'eyelid_MSH_OLD', 'Eyelash_mesh'
@@ -32,43 +45,261 @@ targets = [ 'Blink_L',
             'OuterBrowDown_L',
             'OuterBrowDown_R']
 
-# create dummy shapes
-sourceDup, targetDup = [ cmds.duplicate(n, returnRootsOnly=True, n=n+'_dummy')[0] for n in (source, target)]
-cmds.parent(sourceDup, targetDup, world=True)
-sourceShp = [ s for s in cmds.listRelatives(source, shapes=True) if cmds.getAttr(s+'.intermediateObject') != 1 ][0]
-sourceDupShp = [ s for s in cmds.listRelatives(sourceDup, shapes=True) if cmds.getAttr(s+'.intermediateObject') != 1 ][0]
-cmds.connectAttr(sourceShp+'.outMesh', sourceDupShp+'.inMesh', f=True)
-
-# create wrap
-cmds.select(targetDup, sourceDup)
-mel.eval('CreateWrap;')
-wrap = [ w for w in cmds.listHistory(targetDup) if cmds.nodeType(w) == 'wrap' ][0]
-cmds.setAttr(wrap+'.autoWeightThreshold', 0)
-cmds.setAttr(wrap+'.falloffMode', 0)
-cmds.setAttr(wrap+'.maxDistance', 0)
-
-# create new targets
-targetGrp = cmds.createNode('transform', n='newTargets_GRP')
-newTargets = []
-for tgt in targets:
+def getShapePath(mesh):
+    '''Return the dag path of the mesh shape of a transform or shape name.'''
+    selection = om.MSelectionList()
+    selection.add(str(mesh))
+    return selection.getDagPath(0).extendToShape()
+
+def getPoints(mesh, space=om.MSpace.kWorld):
+    '''Return the vertex positions of a mesh as a (V, 3) numpy array.'''
+    points = om.MFnMesh(getShapePath(mesh)).getPoints(space)
+    return np.array(points, dtype=np.float64).reshape(-1, 4)[:, :3]
+
+def getTopology(mesh):
+    '''Return (polygon vertex counts, polygon vertex ids) of a mesh as numpy arrays.'''
+    counts, connects = om.MFnMesh(getShapePath(mesh)).getVertices()
+    return np.array(counts, dtype=np.int64), np.array(connects, dtype=np.int64)
+
+def getTopologyHash(mesh):
+    '''Return the topology digest of a mesh, used to validate data saved for it.'''
+    return spu.topologyHash(*getTopology(mesh))
+
+def getAdjacency(mesh):
+    '''Return the vertex adjacency of a mesh as CSR arrays (offsets, neighbors), cached by topology.'''
+    counts, connects = getTopology(mesh)
+    return spu.getVertexAdjacency(counts, connects, om.MFnMesh(getShapePath(mesh)).numVertices)
+
+def getSymmetryMap(mesh, axis=0, tolerance=1e-3):
+    '''Return the mirrored vertex id of every vertex of a mesh across the world plane normal to axis, -1 if none.
+    Cached by topology and point positions.
+    '''
+    return spu.getSymmetryMap(getPoints(mesh), getTopologyHash(mesh), axis, tolerance)
+
+def getTriangleIndex(mesh, space=om.MSpace.kWorld):
+    '''Return the closest point index of a mesh triangles, cached by points and topology.'''
+    return spu.getTriangleIndex(getPoints(mesh, space), spu.triangulate(*getTopology(mesh)))
+
+def getPlug(plugName):
+    selection = om.MSelectionList()
+    selection.add(plugName)
+    return selection.getPlug(0)
+
+def setPlugData(values):
+    '''Set [(plug name or MPlug, data MObject)] through the gzSetPlugData command, as one undoable step.'''
+    if not cmds.pluginInfo(os.path.basename(PLUG_DATA_PLUGIN), query=True, loaded=True):
+        cmds.loadPlugin(PLUG_DATA_PLUGIN, quiet=True)
+    # single slot, emptied whatever happens so a failed call never leaks its data into the next one
+    PENDING_PLUG_DATA['plugs'] = [ (getPlug(plug) if isinstance(plug, str) else plug, data) for plug, data in values ]
+    try:
+        cmds.gzSetPlugData()
+    finally:
+        PENDING_PLUG_DATA.clear()
+
+def sampleTargetDeltas(bshp, targets, mesh, tolerance=1e-5, space=om.MSpace.kObject):
+    '''Turn every target of blendShape bshp on alone and read the points of mesh, one bulk getPoints each.
+    Return (base points, [(target, moved vertex ids, offsets (moved, 3))]), only vertices moved by more than
+    tolerance are kept.
+    '''
+    previous = dict([ (t, cmds.getAttr(bshp + '.' + t)) for t in targets ])
     for t in targets: cmds.setAttr(bshp + '.' + t, 0)
-    cmds.setAttr(bshp + '.' + tgt, 1)
-    new = cmds.duplicate(targetDup, returnRootsOnly=True, n=tgt)[0]
-    cmds.parent(new, targetGrp)
-    newTargets.append(new)
-cmds.hide(targetGrp)
-for t in targets: cmds.setAttr(bshp + '.' + t, 0)
+    base = getPoints(mesh, space)
+
+    deltas, last = [], None
+    try:
+        with ProgressReporter(len(targets), 'Sample blendShape targets on "{}"...'.format(mesh)) as progress:
+            for tgt in targets:
+                if last: cmds.setAttr(bshp + '.' + last, 0)
+                cmds.setAttr(bshp + '.' + tgt, 1)
+                last = tgt
+                offsets = getPoints(mesh, space) - base
+                moved = np.flatnonzero((offsets ** 2).sum(axis=1) > tolerance * tolerance)
+                deltas.append((tgt, moved, offsets[moved]))
+                if not progress.step(): break
+    finally:
+        for t in targets: cmds.setAttr(bshp + '.' + t, previous[t])
+    return base, deltas
+
+def getWorldMatrix(mesh):
+    '''Return the world matrix of a mesh as a (4, 4) numpy array.'''
+    matrix = getShapePath(mesh).inclusiveMatrix()
+    return np.array([ [ matrix.getElement(r, c) for c in range(4) ] for r in range(4) ])
+
+def getBindingDirectory():
+    '''Return the default wrap binding cache directory, in the user maya directory.'''
+    return os.path.join(cmds.internalVar(userAppDir=True), 'wrapBindings')
+
+def getWrapBinding(source, target, cacheDir=None, sourcePoints=None):
+    '''Bind the world points of target to the closest triangles of source, at sourcePoints (world) if given.
+    The binding is reused from cacheDir (default getBindingDirectory()) while both meshes keep their topology
+    and rest points, and rebuilt otherwise.
+    '''
+    sourcePoints = getPoints(source) if sourcePoints is None else sourcePoints
+    return wru.getCachedBinding(cacheDir or getBindingDirectory(), sourcePoints, spu.triangulate(*getTopology(source)),
+                                getPoints(target), getTopologyHash(target))[0]
+
+def getTargetAliases(bshp):
+    '''Return the target aliases of blendShape bshp, in weight index order.'''
+    aliases = cmds.aliasAttr(bshp, query=True) or []
+    weights = [ (int(attr[7:-1]), alias) for alias, attr in zip(aliases[::2], aliases[1::2])
+                if attr.startswith('weight[') ]
+    return [ alias for index, alias in sorted(weights) ]
+
+def fanOutTargetDeltas(bindings, base, deltas, matrices=None, tolerance=1e-5, chunk=16):
+    '''Carry sparse source deltas [(name, vertex ids, offsets)] from source base points through many wrap bindings.
+    Each chunk of source deltas is densified once and evaluated by every binding. matrices are the world matrices of
+    the wrapped meshes, their deltas are returned in object space.
+    Return sparse target deltas [(name, vertex ids, offsets)] per binding.
+    '''
+    matrices = [ None ] * len(bindings) if matrices is None else matrices
+    toObjects = [ np.eye(3) if m is None else np.linalg.inv(m)[:3, :3] for m in matrices ]
+    results = [ [] for b in bindings ]
+    for first in range(0, len(deltas), chunk):
+        group = deltas[first:first + chunk]
+        dense = np.zeros((len(group), len(base), 3))
+        for x, (name, vertices, offsets) in enumerate(group):
+            dense[x, vertices] = offsets
+        for binding, toObject, result in zip(bindings, toObjects, results):
+            for (name, vertices, offsets), moved in zip(group, wru.wrapDeltas(binding, base, dense)):
+                moved = np.dot(moved, toObject)
+                vertices = np.flatnonzero((moved ** 2).sum(axis=1) > tolerance * tolerance)
+                result.append((name, vertices, moved[vertices]))
+    return results
+
+def wrapTargetDeltas(binding, base, deltas, matrix=None, tolerance=1e-5, chunk=16):
+    '''Carry sparse source deltas through a single wrap binding, see fanOutTargetDeltas.'''
+    return fanOutTargetDeltas([binding], base, deltas, [matrix], tolerance, chunk)[0]
+
+def conflictingTargetNames(bshp, names):
+    '''Return the names that cannot alias new targets of blendShape bshp: existing attributes or repeated names.'''
+    seen, conflicts = set(), []
+    for name in names:
+        if name in seen or cmds.attributeQuery(name, node=bshp, exists=True):
+            conflicts.append(name)
+        seen.add(name)
+    return conflicts
+
+def writeBlendShapeTargets(bshp, deltas, geometryIndex=0):
+    '''Write sparse target deltas [(name, vertex ids, offsets)] straight into the inputTarget data of blendShape bshp,
+    no target mesh needed. Targets are added after the existing ones, aliased with their name. Return their indices.
+    Names are checked before anything is written and the whole write is a single undo step.
+    '''
+    conflicts = conflictingTargetNames(bshp, [ name for name, vertices, offsets in deltas ])
+    if conflicts:
+        raise ValueError('{} already on "{}".'.format(', '.join(conflicts), bshp))
+
+    used = cmds.getAttr(bshp + '.weight', multiIndices=True) or []
+    first = max(used) + 1 if used else 0
+    indices = [ first + x for x in range(len(deltas)) ]
+    values = []
+    for index, (name, vertices, offsets) in zip(indices, deltas):
+        item = '{}.inputTarget[{}].inputTargetGroup[{}].inputTargetItem[6000]'.format(bshp, geometryIndex, index)
+
+        points = np.ones((len(offsets), 4))
+        points[:, :3] = offsets
+        values.append((item + '.inputPointsTarget', om.MFnPointArrayData().create(om.MPointArray(points.tolist()))))
+        fnComp = om.MFnSingleIndexedComponent()
+        component = fnComp.create(om.MFn.kMeshVertComponent)
+        fnComp.addElements(np.asarray(vertices, dtype=np.int64).tolist())
+        fnComponents = om.MFnComponentListData()
+        components = fnComponents.create()
+        fnComponents.add(component)
+        values.append((item + '.inputComponentsTarget', components))
+
+    cmds.undoInfo(openChunk=True, chunkName='writeBlendShapeTargets')
+    try:
+        setPlugData(values)
+        for index, (name, vertices, offsets) in zip(indices, deltas):
+            cmds.setAttr('{}.weight[{}]'.format(bshp, index), 0)
+            cmds.aliasAttr(name, '{}.weight[{}]'.format(bshp, index))
+    finally:
+        cmds.undoInfo(closeChunk=True)
+    return indices
+
+def retargetBlendShape(bshp=bshp, source=source, target=target, targets=None, tolerance=1e-5, wrapDeformer=False,
+                       cacheDir=None):
+    '''Rebuild the targets of blendShape bshp (deforming source) on target, every alias of bshp when targets is None.
+    Each target is sampled as a sparse delta and written into the new blendShape directly, without target meshes.
+    By default the deltas go through a numpy wrap binding (cached in cacheDir), wrapDeformer uses a
+    Maya wrap deformer instead.
+    '''
+    if not wrapDeformer:
+        return retargetBlendShapes(bshp, source, [target], targets, tolerance, cacheDir)[target]
+
+    deltas = sampleWrapDeformerDeltas(bshp, source, target, targets or getTargetAliases(bshp), tolerance)
+
+    # add new Blendshape
+    newBshp = cmds.blendShape(target, frontOfChain=True, n=target + '_blendShape')[0]
+    writeBlendShapeTargets(newBshp, deltas)
+
+    return newBshp
+
+def retargetBlendShapes(bshp, source, destinations, targets=None, tolerance=1e-5, cacheDir=None):
+    '''Rebuild the targets of blendShape bshp (deforming source) on every destination mesh (lashes, brows, teeth...),
+    every alias of bshp when targets is None. Each source target is sampled once and fanned out to the wrap bindings
+    of all destinations. Return {destination: new blendShape}.
+    '''
+    targets = targets or getTargetAliases(bshp)
+    base, sourceDeltas = sampleTargetDeltas(bshp, targets, source, tolerance, om.MSpace.kWorld)
+    bindings = [ getWrapBinding(source, dst, cacheDir, base) for dst in destinations ]
+    matrices = [ getWorldMatrix(dst) for dst in destinations ]
+
+    newBshps = dict()
+    for dst, deltas in zip(destinations, fanOutTargetDeltas(bindings, base, sourceDeltas, matrices, tolerance)):
+        newBshps[dst] = cmds.blendShape(dst, frontOfChain=True, n=dst + '_blendShape')[0]
+        writeBlendShapeTargets(newBshps[dst], deltas)
+    return newBshps
+
+def exportTargetLibrary(filePath, bshp=bshp, mesh=source, targets=None, tolerance=1e-5, half=False, pca=False,
+                        energy=0.9999):
+    '''Sample the targets of blendShape bshp (every alias when None) on mesh and write only their moved vertices to
+    a ".btl" target library.
+    half stores float16 deltas, pca compresses correlated targets into a low rank basis keeping energy.
+    '''
+    base, deltas = sampleTargetDeltas(bshp, targets or getTargetAliases(bshp), mesh, tolerance)
+    return tlu.writeTargetLibrary(filePath, mesh, deltas, len(base), getTopologyHash(mesh), half, pca, energy)
+
+def importTargetLibrary(filePath, mesh, targets=None, bshp=None, tolerance=1e-5):
+    '''Add the given targets of a ".btl" library (every target when None) to blendShape bshp, a new blendShape on mesh
+    when not given. Only the requested targets are read from the file. Return the blendShape.
+    '''
+    meshName, names, numVertex, topoHash = tlu.readLibraryInfo(filePath)
+    if topoHash and topoHash != getTopologyHash(mesh):
+        return om.MGlobal.displayError('"{}" topology does not match "{}".'.format(mesh, filePath))
+
+    if bshp:
+        conflicts = conflictingTargetNames(bshp, names if targets is None else targets)
+        if conflicts:
+            return om.MGlobal.displayError('{} already on "{}".'.format(', '.join(conflicts), bshp))
 
-# add new Blendshape
-newBshp = cmds.blendShape(target, frontOfChain=True, n=target + '_blendShape')[0]
+    deltas = tlu.readTargetLibrary(filePath, targets, tolerance)
+    if not bshp:
+        bshp = cmds.blendShape(mesh, frontOfChain=True, n=mesh + '_blendShape')[0]
+    writeBlendShapeTargets(bshp, deltas)
+    return bshp
 
-for x, newTgt in enumerate(newTargets):
-    last_used_index = cmds.blendShape(target, q=True, weightCount=True)
-    new_target_index = 0 if last_used_index == 0 else last_used_index + 1
-    cmds.select(newTgt)
-    cmds.blendShape(newBshp, e=True, target=(target, new_target_index, newTgt, 1.0))
+def sampleWrapDeformerDeltas(bshp, source, target, targets, tolerance=1e-5):
+    '''Sample the targets of blendShape bshp on a copy of target wrapped to source. Return sparse deltas.'''
+    # create dummy shapes
+    sourceDup, targetDup = [ cmds.duplicate(n, returnRootsOnly=True, n=n+'_dummy')[0] for n in (source, target)]
+    cmds.parent(sourceDup, targetDup, world=True)
+    sourceShp = [ s for s in cmds.listRelatives(source, shapes=True) if cmds.getAttr(s+'.intermediateObject') != 1 ][0]
+    sourceDupShp = [ s for s in cmds.listRelatives(sourceDup, shapes=True) if cmds.getAttr(s+'.intermediateObject') != 1 ][0]
+    cmds.connectAttr(sourceShp+'.outMesh', sourceDupShp+'.inMesh', f=True)
 
-# clean up
-cmds.delete(sourceDup, sourceDup + 'Base', targetDup, targetGrp)
+    # create wrap
+    cmds.select(targetDup, sourceDup)
+    mel.eval('CreateWrap;')
+    wrap = [ w for w in cmds.listHistory(targetDup) if cmds.nodeType(w) == 'wrap' ][0]
+    cmds.setAttr(wrap+'.autoWeightThreshold', 0)
+    cmds.setAttr(wrap+'.falloffMode', 0)
+    cmds.setAttr(wrap+'.maxDistance', 0)
 
+    try:
+        return sampleTargetDeltas(bshp, targets, targetDup, tolerance)[1]
+    finally:
+        # clean up
+        cmds.delete(sourceDup, sourceDup + 'Base', targetDup)
 
+if __name__ == '__main__':
+    retargetBlendShape(targets=targets)
@@ -1,8 +1,13 @@
+import time
+from collections import OrderedDict
+
 from maya import cmds
 from maya import OpenMaya
 from ngSkinTools2 import  api
 from ngSkinTools2.api import init_layers, Layers
 
+from GZ_utils import skinUtils as skn
+
 def getNgSkinNode(skinCluster):
     ngNode = [ node for node in cmds.listConnections(skinCluster) if cmds.nodeType(node) == 'ngst2SkinLayerData']
     return ngNode[0] if ngNode else None
@@ -23,40 +28,71 @@ def copySkin(source=None, target=None, vertexID=False):
     if not source or not target:
         return OpenMaya.MGlobal.displayInfo('Please select skinned source mesh and then target mesh to copy the skin.')
 
-    # get source skinCluster
-    sclstSrc = api.target_info.get_related_skin_cluster(source)
-    influSrc = cmds.skinCluster(sclstSrc, q=True, influence=True)
+    copySkinToTargets(source, [target], vertexID)
 
-    # get target skinCluster
-    sclstTgt = api.target_info.get_related_skin_cluster(target)
-    if not sclstTgt:
-        sclstTgt = cmds.skinCluster(influSrc, target, tsb=True)[0]
-        sclstTgt = cmds.rename(sclstTgt, 'sclst_'+target)
-    influTgt = cmds.skinCluster(sclstTgt, q=True, influence=True)
-    print('influTgt :', influTgt)
+def copySkinToTargets(source=None, targets=None, vertexID=False):
+    '''Transfer the skin of one source mesh to many targets with ngSkinTools.
+    The source layers are set up once, every target gets its missing influences in one edit, the transfers run back
+    to back and the ngSkinTools data is cleaned once at the end. Return the seconds spent per stage.
+    '''
+    if not source or not targets:
+        sel = cmds.ls(sl=True)
+        if len(sel) >= 2: source, targets = sel[0], sel[1:]
+    if not source or not targets:
+        return OpenMaya.MGlobal.displayInfo('Please select skinned source mesh and then target meshes to copy the skin.')
 
-    # make sure all source influences added to skinCluster target
-    notAdded = [ influ for influ in influSrc if influ not in influTgt ]
-    for influ in notAdded:
-        cmds.skinCluster(sclstTgt, edit=True, addInfluence=influ, weight=0)
+    timings = OrderedDict([ (stage, 0.0) for stage in ('source setup', 'influence sync', 'transfer', 'clean up') ])
+    start = time.time()
 
-    # init ng in source
+    # get source skinCluster and init ng in source, once
+    sclstSrc, influSrc = skn.getSkinCluster(source)
+    if not sclstSrc:
+        return OpenMaya.MGlobal.displayInfo('"{}" is not skinned.'.format(source))
     isSourceHasNg = hasNgSkinNode(sclstSrc)
     if not isSourceHasNg:
         initNgSkin(sclstSrc)
 
-    # transfer layer
     infl_config = api.InfluenceMappingConfig.transfer_defaults()
     infl_config.use_label_matching = False
     infl_config.use_distance_matching = True
     infl_config.use_name_matching = False
     useVertexId = api.VertexTransferMode.vertexId if vertexID else api.VertexTransferMode.closestPoint
-    api.transfer_layers(source, target, vertex_transfer_mode=useVertexId, influences_mapping_config=infl_config)
+    timings['source setup'] = time.time() - start
 
-    # clean up
-    cmds.delete(getNgSkinNode(sclstTgt))
-    if not isSourceHasNg:
-        cmds.delete(getNgSkinNode(sclstSrc))
-    cmds.select(target)
+    # make sure all source influences added to every target skinCluster
+    start = time.time()
+    sclstTgts = []
+    for target in targets:
+        sclstTgt, influTgt = skn.getSkinCluster(target)
+        if not sclstTgt:
+            sclstTgt = cmds.skinCluster(influSrc, target, tsb=True)[0]
+            sclstTgt = cmds.rename(sclstTgt, 'sclst_'+target)
+        else:
+            notAdded = [ influ for influ in influSrc if influ not in influTgt ]
+            if notAdded:
+                cmds.skinCluster(sclstTgt, edit=True, addInfluence=notAdded, weight=0)
+        sclstTgts.append(sclstTgt)
+    timings['influence sync'] = time.time() - start
+
+    # transfer layer
+    start = time.time()
+    try:
+        for target in targets:
+            api.transfer_layers(source, target, vertex_transfer_mode=useVertexId, influences_mapping_config=infl_config)
+        timings['transfer'] = time.time() - start
+    finally:
+        # clean up
+        start = time.time()
+        ngNodes = [ getNgSkinNode(sclst) for sclst in sclstTgts ]
+        if not isSourceHasNg:
+            ngNodes.append(getNgSkinNode(sclstSrc))
+        ngNodes = [ node for node in ngNodes if node ]
+        if ngNodes:
+            cmds.delete(ngNodes)
+        timings['clean up'] = time.time() - start
 
-    OpenMaya.MGlobal.displayInfo('Skin copied.')
+    cmds.select(targets)
+    for stage, seconds in timings.items():
+        print('{:<16}: {:.3f}s'.format(stage, seconds))
+    OpenMaya.MGlobal.displayInfo('Skin copied to {} meshes.'.format(len(targets)))
+    return timings
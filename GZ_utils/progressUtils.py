@@ -0,0 +1,76 @@
+import time
+
+from maya import cmds, mel
+
+class ProgressReporter(object):
+    '''
+    Main progress bar for long-running tools, with its updates batched.
+    The bar is redrawn at most every interval seconds or every percent of progress, whichever comes first,
+    and the escape key is only checked at those redraws. In batch mode (mayapy) nothing is drawn.
+
+    with ProgressReporter(len(items), 'Working...') as progress:
+        for item in items:
+            doSomething(item)
+            if not progress.step(): break
+    '''
+
+    def __init__(self, maxValue, status='', interruptable=True, interval=0.1, percent=1.0):
+        self.maxValue = max(int(maxValue), 1)
+        self.status = status
+        self.interruptable = interruptable
+        self.interval = interval
+        self.percent = percent
+
+        self.value = 0
+        self.shownValue = 0
+        self.shownTime = 0.0
+        self.cancelled = False
+        self.progressBar = None
+        if not cmds.about(batch=True):
+            self.progressBar = mel.eval('$tmp = $gMainProgressBar')
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.end()
+        return False
+
+    def begin(self):
+        if self.progressBar:
+            cmds.progressBar(self.progressBar, edit=True, beginProgress=True, isInterruptable=self.interruptable,
+                             maxValue=self.maxValue, status=self.status)
+        self.shownTime = time.time()
+
+    def step(self, value=1):
+        '''Add value to the progress. Return False once the user cancelled.'''
+        self.value += value
+        self.update()
+        return not self.cancelled
+
+    def setStatus(self, status):
+        '''Change the status text, shown with the next redraw.'''
+        self.status = status
+        self.update()
+
+    def update(self, force=False):
+        now = time.time()
+        due = now - self.shownTime >= self.interval or \
+              (self.value - self.shownValue) * 100.0 / self.maxValue >= self.percent
+        if not (force or due):
+            return
+
+        if self.progressBar:
+            cmds.progressBar(self.progressBar, edit=True, progress=min(self.value, self.maxValue),
+                             status=self.status)
+            if self.interruptable and cmds.progressBar(self.progressBar, query=True, isCancelled=True):
+                self.cancelled = True
+        self.shownValue, self.shownTime = self.value, now
+
+    def isCancelled(self):
+        return self.cancelled
+
+    def end(self):
+        if self.progressBar:
+            cmds.progressBar(self.progressBar, edit=True, endProgress=True)
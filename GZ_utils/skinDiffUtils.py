@@ -0,0 +1,91 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+
+if __name__ == '__main__':
+    # run as a script (python GZ_utils/skinDiffUtils.py) the repository root is not on the path yet
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from GZ_utils import skinStoreUtils as sst
+
+DIFF_TOLERANCE = 1e-4
+
+def readWeightFile(filePath):
+    '''Read a ".sw", ".swb" or ".swc" skin file. Return a SkinData.'''
+    return sst.readSkinFile(filePath)
+
+def _entries(data, column, numColumns):
+    '''Return the (vertex * numColumns + influence column) keys and the weights of a SkinData.'''
+    counts = np.diff(data.offsets.astype(np.int64))
+    vertices = np.repeat(data.vertices.astype(np.int64), counts)
+    columns = np.array([ column[inf] for inf in data.influences ], dtype=np.int64)
+    return vertices * numColumns + columns[data.indices.astype(np.int64)], data.values.astype(np.float64)
+
+def diffSkinData(dataA, dataB, tolerance=DIFF_TOLERANCE):
+    '''Compare two SkinData, influences matched by name, without building dense matrices.
+
+    Return a dict: 'maxDelta' and 'l1Delta' per vertex (float32 arrays of numVertex), 'vertices' the ids changed
+    by more than tolerance, 'maxChange', 'added' and 'removed' influences of B compared to A.
+    '''
+    if dataA.numVertex != dataB.numVertex:
+        raise ValueError('Vertex counts differ: {} and {}.'.format(dataA.numVertex, dataB.numVertex))
+    if dataA.topologyHash and dataB.topologyHash and dataA.topologyHash != dataB.topologyHash:
+        raise ValueError('Topologies differ.')
+    numVertex = dataA.numVertex
+
+    influences = list(dataA.influences) + [ inf for inf in dataB.influences if inf not in dataA.influences ]
+    column = dict([ (inf, x) for x, inf in enumerate(influences) ])
+    keysA, valuesA = _entries(dataA, column, len(influences))
+    keysB, valuesB = _entries(dataB, column, len(influences))
+
+    # sum A - B per (vertex, influence), then reduce the sorted entries per vertex
+    keys = np.concatenate([keysA, keysB])
+    values = np.concatenate([valuesA, -valuesB])
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    delta = np.abs(np.add.reduceat(values, starts)) if len(keys) else np.zeros(0)
+    vertices = keys[starts] // max(len(influences), 1)
+
+    l1Delta = np.bincount(vertices, weights=delta, minlength=numVertex).astype(np.float32)
+    maxDelta = np.zeros(numVertex, dtype=np.float32)
+    if len(delta):
+        rowStarts = np.flatnonzero(np.r_[True, vertices[1:] != vertices[:-1]])
+        maxDelta[vertices[rowStarts]] = np.maximum.reduceat(delta, rowStarts)
+
+    return dict(maxDelta=maxDelta, l1Delta=l1Delta, vertices=np.flatnonzero(maxDelta > tolerance),
+                maxChange=float(maxDelta.max()) if numVertex else 0.0,
+                added=[ inf for inf in dataB.influences if inf not in dataA.influences ],
+                removed=[ inf for inf in dataA.influences if inf not in dataB.influences ])
+
+def formatDiffReport(report, nameA='A', nameB='B'):
+    '''Return a short text summary of a diffSkinData report.'''
+    changed = report['vertices']
+    lines = ['{} -> {}: {} of {} vertices changed.'.format(nameA, nameB, len(changed), len(report['maxDelta']))]
+    if len(changed):
+        lines.append('max change {:.6f}, mean change {:.6f}, total L1 {:.4f}'.format(
+            report['maxChange'], float(report['maxDelta'][changed].mean()), float(report['l1Delta'].sum())))
+        worst = changed[np.argsort(report['maxDelta'][changed])[::-1][:10]]
+        lines.append('most changed vertices: ' + ', '.join([ '{} ({:.4f})'.format(v, report['maxDelta'][v])
+                                                             for v in worst ]))
+    if report['added']:
+        lines.append('added influences: ' + ', '.join(report['added']))
+    if report['removed']:
+        lines.append('removed influences: ' + ', '.join(report['removed']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the weights of two ".sw", ".swb" or ".swc" skin files.')
+    parser.add_argument('fileA')
+    parser.add_argument('fileB')
+    parser.add_argument('--tolerance', type=float, default=DIFF_TOLERANCE)
+    parser.add_argument('--vertices', action='store_true', help='print the changed vertex ids')
+    args = parser.parse_args()
+
+    report = diffSkinData(readWeightFile(args.fileA), readWeightFile(args.fileB), args.tolerance)
+    print(formatDiffReport(report, args.fileA, args.fileB))
+    if args.vertices:
+        print(' '.join([ str(v) for v in report['vertices'] ]))
+    raise SystemExit(1 if len(report['vertices']) else 0)
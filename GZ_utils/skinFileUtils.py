@@ -0,0 +1,303 @@
+import os
+import re
+import mmap
+import struct
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+LEGACY_EXT, BINARY_EXT = '.sw', '.swb'
+
+# binary ".swb" layout, little endian:
+#   header  : magic, version, flags, mesh vertex count, row count, influence count, value count,
+#             topology hash, mesh name size, influence table size
+#   strings : mesh name, influence names joined by new lines (utf-8)
+#   arrays  : vertices (uint32, rows), offsets (uint32, rows + 1), indices (uint16, values),
+#             weights (float32 or uint16 when quantized, values). Every block starts on 8 bytes.
+BINARY_MAGIC = b'GZSW'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHHIIIQ16sII')
+FLAG_QUANTIZED = 1
+QUANTIZE_SCALE = 65535.0
+
+# ".sw" text tokens, parsed without eval
+LEGACY_BLOCK_SIZE = 1 << 24
+LEGACY_NAME_RE = re.compile(br"u?'([^']*)'")
+LEGACY_VERTEX_RE = re.compile(br"\.vtx\[(\d+)\],\[")
+LEGACY_PAIR_NAME_RE = re.compile(br"\(u?'([^']*)', ")
+LEGACY_PAIR_WEIGHT_RE = re.compile(br"', ([^)]+)\)")
+
+
+class SkinData(namedtuple('SkinData', 'meshName influences vertices offsets indices values numVertex topologyHash')):
+    '''
+    Sparse (CSR) skin weights. Row i holds the weights of vertex vertices[i]:
+    values[offsets[i]:offsets[i+1]] for the influence columns indices[offsets[i]:offsets[i+1]].
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def fromDense(cls, meshName, influences, weights, vertices=None, numVertex=None, topologyHash=b''):
+        '''Build from a weight matrix (vertex x influence), zero weights are dropped.'''
+        weights = np.asarray(weights)
+        if vertices is None:
+            vertices = np.arange(len(weights))
+        rows, indices = np.nonzero(weights)
+        offsets = np.zeros(len(weights) + 1, dtype=np.uint32)
+        np.cumsum(np.bincount(rows, minlength=len(weights)), out=offsets[1:])
+        numVertex = len(weights) if numVertex is None else numVertex
+
+        return cls(meshName, list(influences), np.asarray(vertices, dtype=np.uint32), offsets,
+                   indices.astype(np.uint16), weights[rows, indices].astype(np.float64), numVertex, topologyHash)
+
+    def toDense(self):
+        '''Return the weight matrix (row x influence) as float64.'''
+        weights = np.zeros((len(self.vertices), len(self.influences)), dtype=np.float64)
+        rows = np.repeat(np.arange(len(self.vertices)), np.diff(self.offsets.astype(np.int64)))
+        weights[rows, self.indices] = self.values
+        return weights
+
+
+def isBinarySkin(filePath):
+    with open(filePath, 'rb') as fileObj:
+        return fileObj.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+def readSkin(filePath):
+    '''Read a ".sw" or ".swb" file, the format is detected from the file content. Return a SkinData.'''
+    if isBinarySkin(filePath):
+        return readBinarySkin(filePath)
+    return readLegacySkin(filePath)
+
+def writeSkin(filePath, meshName, influences, weights, binary=True, quantize=False, topologyHash=b''):
+    '''Write a weight matrix (vertex x influence) to ".swb" when binary, otherwise to ".sw". Return filePath.'''
+    if binary:
+        data = SkinData.fromDense(meshName, influences, weights, topologyHash=topologyHash)
+        writeBinarySkin(filePath, data, quantize=quantize)
+    else:
+        writeLegacySkin(filePath, meshName, influences, weights)
+    return filePath
+
+def writeLegacySkin(filePath, meshName, influences, weights):
+    '''Write a weight matrix (vertex x influence) to the ".sw" text format.
+
+    First line is the influence list, then one "mesh.vtx[i],[(influence, weight), ...]" line per vertex.
+    '''
+    prefixes = [ "('{}', ".format(inf) for inf in influences ]
+    with open(filePath, 'w') as fileObj:
+        fileObj.write(str([str(inf) for inf in influences]) + '\n')
+        for i, row in enumerate(weights.tolist()):
+            values = ', '.join([ p + repr(w) + ')' for p, w in zip(prefixes, row) ])
+            fileObj.write('{}.vtx[{}],[{}]\n'.format(meshName, i, values))
+
+def _parseLegacyBlock(block, column):
+    '''Parse complete ".sw" lines. Return (vertex ids, pair rows, pair influence columns, pair weights).'''
+    vertices = LEGACY_VERTEX_RE.findall(block)
+    names = LEGACY_PAIR_NAME_RE.findall(block)
+    weights = LEGACY_PAIR_WEIGHT_RE.findall(block)
+
+    # a pair belongs to the last vertex header ",[" before its "("
+    buf = np.frombuffer(block, dtype=np.uint8)
+    headers = np.flatnonzero((buf[:-1] == ord(',')) & (buf[1:] == ord('[')))
+    pairs = np.flatnonzero(buf == ord('('))
+    if len(headers) != len(vertices) or not len(pairs) == len(names) == len(weights):
+        raise ValueError('Malformed ".sw" skin data.')
+    rows = np.searchsorted(headers, pairs, side='right') - 1
+
+    try:
+        columns = np.fromiter([ column[n] for n in names ], dtype=np.uint16, count=len(names))
+    except KeyError as err:
+        raise ValueError('Influence {} is not in the ".sw" influence list.'.format(err))
+
+    return (np.array(vertices, dtype=bytes).astype(np.int64), rows, columns,
+            np.array(weights, dtype=bytes).astype(np.float64))
+
+def readLegacySkin(filePath, blockSize=LEGACY_BLOCK_SIZE):
+    '''Read a ".sw" text file in blocks, without evaluating its content. Return a SkinData.'''
+    with open(filePath, 'rb') as fileObj:
+        header = fileObj.readline().strip()
+        if not (header.startswith(b'[') and header.endswith(b']')):
+            raise ValueError('"{}" is not a ".sw" skin file.'.format(filePath))
+        influences = [ n.decode('utf-8') for n in LEGACY_NAME_RE.findall(header) ]
+        column = dict([ (inf.encode('utf-8'), x) for x, inf in enumerate(influences) ])
+
+        meshName, parsed, numRows, tail = '', [], 0, b''
+        while True:
+            chunk = fileObj.read(blockSize)
+            block = tail + chunk
+            if chunk:
+                cut = block.rfind(b'\n') + 1
+                block, tail = block[:cut], block[cut:]
+            if not meshName and block.strip():
+                meshName = block[:block.find(b'.vtx[')].strip().decode('utf-8')
+            if block:
+                vertices, rows, columns, weights = _parseLegacyBlock(block, column)
+                parsed.append((vertices, rows + numRows, columns, weights))
+                numRows += len(vertices)
+            if not chunk:
+                break
+
+    if parsed:
+        vertices, rows, columns, weights = [ np.concatenate(p) for p in zip(*parsed) ]
+    else:
+        vertices, rows = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        columns, weights = np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.float64)
+
+    # zero weights are written to ".sw" files but not kept
+    keep = weights != 0
+    offsets = np.zeros(numRows + 1, dtype=np.uint32)
+    np.cumsum(np.bincount(rows[keep], minlength=numRows), out=offsets[1:])
+
+    return SkinData(meshName, influences, vertices.astype(np.uint32), offsets, columns[keep], weights[keep],
+                    numRows, b'')
+
+def _align(size):
+    return (size + 7) & ~7
+
+def _binaryLayout(header):
+    '''Return the byte position of every array block described by an unpacked header.'''
+    magic, version, flags, numVertex, numRows, numInfluence, numValues, topoHash, nameSize, infSize = header
+    position = _align(BINARY_HEADER.size + nameSize + infSize)
+    layout = dict()
+    for key, dtype, count in (('vertices', np.uint32, numRows),
+                              ('offsets', np.uint32, numRows + 1),
+                              ('indices', np.uint16, numValues),
+                              ('values', np.uint16 if flags & FLAG_QUANTIZED else np.float32, numValues)):
+        layout[key] = (position, np.dtype(dtype), count)
+        position = _align(position + np.dtype(dtype).itemsize * count)
+    return layout
+
+def writeBinarySkin(filePath, data, quantize=False):
+    '''Write a SkinData to the binary ".swb" format. quantize stores weights as uint16 instead of float32.'''
+    name = data.meshName.encode('utf-8')
+    influences = '\n'.join(data.influences).encode('utf-8')
+    flags = FLAG_QUANTIZED if quantize else 0
+    header = (BINARY_MAGIC, BINARY_VERSION, flags, data.numVertex, len(data.vertices), len(data.influences),
+              len(data.values), data.topologyHash.ljust(16, b'\0'), len(name), len(influences))
+
+    values = np.asarray(data.values, dtype=np.float32)
+    if quantize:
+        values = np.round(np.clip(values, 0.0, 1.0) * QUANTIZE_SCALE).astype(np.uint16)
+    arrays = dict(vertices=data.vertices, offsets=data.offsets, indices=data.indices, values=values)
+
+    layout = _binaryLayout(header)
+    with open(filePath, 'wb') as fileObj:
+        fileObj.write(BINARY_HEADER.pack(*header) + name + influences)
+        for key in ('vertices', 'offsets', 'indices', 'values'):
+            position, dtype, count = layout[key]
+            fileObj.write(b'\0' * (position - fileObj.tell()))
+            fileObj.write(np.ascontiguousarray(arrays[key], dtype=dtype).tobytes())
+
+def readBinaryHeader(buffer):
+    '''Return (meshName, influences, numVertex, topologyHash, layout) from the start of a ".swb" buffer.'''
+    header = BINARY_HEADER.unpack_from(buffer, 0)
+    if header[0] != BINARY_MAGIC:
+        raise ValueError('Not a binary skin file.')
+    if header[1] > BINARY_VERSION:
+        raise ValueError('Binary skin file version {} is not supported.'.format(header[1]))
+
+    nameSize, infSize = header[-2:]
+    strings = bytes(buffer[BINARY_HEADER.size:BINARY_HEADER.size + nameSize + infSize])
+    influences = strings[nameSize:].decode('utf-8').split('\n') if infSize else []
+    topoHash = header[7] if header[7].strip(b'\0') else b''
+
+    return strings[:nameSize].decode('utf-8'), influences, header[3], topoHash, _binaryLayout(header)
+
+def _binaryArray(buffer, layout, key, positions=None):
+    '''Return an array block of a ".swb" buffer, or only its items at positions (as a copy).'''
+    position, dtype, count = layout[key]
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=position)
+    if positions is not None:
+        array = array[positions]
+    if key == 'values' and dtype == np.uint16:
+        array = array / np.float32(QUANTIZE_SCALE)
+    return array
+
+def findRows(fileVertices, vertices):
+    '''Return (rows, vertices) of the given vertex ids found in fileVertices, vertex ids being sorted.'''
+    vertices = np.unique(np.asarray(vertices, dtype=np.int64))
+    order = None
+    if len(fileVertices) > 1 and np.any(fileVertices[1:] < fileVertices[:-1]):
+        order = np.argsort(fileVertices, kind='stable')
+        fileVertices = fileVertices[order]
+
+    rows = np.minimum(np.searchsorted(fileVertices, vertices), max(len(fileVertices) - 1, 0))
+    found = fileVertices[rows] == vertices if len(fileVertices) else np.zeros(len(vertices), dtype=bool)
+    rows, vertices = rows[found], vertices[found]
+    if order is not None:
+        rows = order[rows]
+
+    return rows, vertices
+
+def _readBinaryRows(buffer, vertices):
+    meshName, influences, numVertex, topoHash, layout = readBinaryHeader(buffer)
+    fileVertices = _binaryArray(buffer, layout, 'vertices')
+    if vertices is None:
+        rows, vertices = np.arange(len(fileVertices)), fileVertices.astype(np.int64)
+    else:
+        rows, vertices = findRows(fileVertices, vertices)
+
+    fileOffsets = _binaryArray(buffer, layout, 'offsets').astype(np.int64)
+    starts, counts = fileOffsets[rows], fileOffsets[rows + 1] - fileOffsets[rows]
+    offsets = np.zeros(len(rows) + 1, dtype=np.uint32)
+    np.cumsum(counts, out=offsets[1:])
+    positions = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+
+    return SkinData(meshName, influences, vertices.astype(np.uint32), offsets,
+                    _binaryArray(buffer, layout, 'indices', positions),
+                    _binaryArray(buffer, layout, 'values', positions), numVertex, topoHash)
+
+def readBinarySkinRows(filePath, vertices=None):
+    '''Read only the rows of the given vertex ids from a ".swb" file, through a memory map. Return a SkinData.
+    Without vertices every row is read.
+    '''
+    with open(filePath, 'rb') as fileObj:
+        buffer = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _readBinaryRows(buffer, vertices)
+    finally:
+        buffer.close()
+
+def readSkinRows(filePath, vertices):
+    '''Read only the rows of the given vertex ids. ".sw" files have to be parsed whole first.'''
+    if isBinarySkin(filePath):
+        return readBinarySkinRows(filePath, vertices)
+
+    data = readLegacySkin(filePath)
+    rows, vertices = findRows(data.vertices, vertices)
+    return SkinData.fromDense(data.meshName, data.influences, data.toDense()[rows], vertices, data.numVertex,
+                              data.topologyHash)
+
+def readBinarySkin(filePath):
+    '''Read a binary ".swb" file. Return a SkinData.'''
+    with open(filePath, 'rb') as fileObj:
+        buffer = fileObj.read()
+    meshName, influences, numVertex, topoHash, layout = readBinaryHeader(buffer)
+    arrays = [ _binaryArray(buffer, layout, key) for key in ('vertices', 'offsets', 'indices', 'values') ]
+
+    return SkinData(meshName, influences, *(arrays + [numVertex, topoHash]))
+
+def convertLegacyDirectory(directory, quantize=False, remove=False):
+    '''Rewrite every ".sw" file of a directory to ".swb". Return the written files.'''
+    converted = []
+    for fileName in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(fileName)
+        if ext != LEGACY_EXT:
+            continue
+        legacyPath = os.path.join(directory, fileName)
+        binaryPath = os.path.join(directory, name + BINARY_EXT)
+        writeBinarySkin(binaryPath, readLegacySkin(legacyPath), quantize=quantize)
+        if remove:
+            os.remove(legacyPath)
+        converted.append(binaryPath)
+        print('{} -> {}'.format(legacyPath, binaryPath))
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert ".sw" skin weight files to the binary ".swb" format.')
+    parser.add_argument('directories', nargs='+')
+    parser.add_argument('--quantize', action='store_true', help='store weights as uint16 instead of float32')
+    parser.add_argument('--remove', action='store_true', help='delete the ".sw" files once converted')
+    args = parser.parse_args()
+    for directory in args.directories:
+        convertLegacyDirectory(directory, quantize=args.quantize, remove=args.remove)
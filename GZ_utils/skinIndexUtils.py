@@ -0,0 +1,127 @@
+import os
+import json
+import mmap
+
+from GZ_utils import skinFileUtils as sfu
+from GZ_utils import skinStoreUtils as sst
+
+# "skinIndex.json" of a skin directory describes every skin file in it, so files can be matched to meshes
+# without being opened. An entry is trusted while the size and modification time of its file are unchanged.
+INDEX_FILE = 'skinIndex.json'
+INDEX_VERSION = 1
+INDEX_EXTS = (sfu.BINARY_EXT, sst.STORE_EXT, sfu.LEGACY_EXT)
+
+def _countLines(filePath, blockSize=sfu.LEGACY_BLOCK_SIZE):
+    count = 0
+    with open(filePath, 'rb') as fileObj:
+        for block in iter(lambda: fileObj.read(blockSize), b''):
+            count += block.count(b'\n')
+    return count
+
+def describeSkinFile(filePath, numVertex=None):
+    '''Return the index entry of a skin file, reading its header only when the format has one.
+    ".sw" files have no header, their lines are counted unless numVertex is given.
+    '''
+    ext = os.path.splitext(filePath)[-1]
+    stat = os.stat(filePath)
+    entry = dict(file=os.path.basename(filePath), format=ext.lstrip('.'), size=stat.st_size, mtime=stat.st_mtime)
+
+    if ext == sst.STORE_EXT:
+        manifest = sst.readManifest(filePath)
+        entry.update(meshName=manifest['meshName'], numVertex=manifest['numVertex'],
+                     topologyHash=manifest['topologyHash'], influences=manifest['influences'])
+    elif sfu.isBinarySkin(filePath):
+        with open(filePath, 'rb') as fileObj:
+            buffer = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            meshName, influences, numVertex, topoHash = sfu.readBinaryHeader(buffer)[:4]
+        finally:
+            buffer.close()
+        entry.update(meshName=meshName, numVertex=numVertex, topologyHash=topoHash.hex(), influences=influences)
+    else:
+        # ".sw": influence list on the first line then one line per vertex
+        with open(filePath, 'rb') as fileObj:
+            header = fileObj.readline()
+        influences = [ n.decode('utf-8') for n in sfu.LEGACY_NAME_RE.findall(header) ]
+        if numVertex is None:
+            numVertex = max(_countLines(filePath) - 1, 0)
+        entry.update(meshName=os.path.splitext(entry['file'])[0], numVertex=numVertex, topologyHash='',
+                     influences=influences)
+    return entry
+
+def _writeIndex(directory, entries):
+    indexPath = os.path.join(directory, INDEX_FILE)
+    tmpPath = '{}.{}.tmp'.format(indexPath, os.getpid())
+    with open(tmpPath, 'w') as fileObj:
+        json.dump(dict(version=INDEX_VERSION, files=entries), fileObj, indent=1, sort_keys=True)
+    os.replace(tmpPath, indexPath)
+
+def _loadIndex(directory):
+    indexPath = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(indexPath):
+        return dict()
+    try:
+        with open(indexPath) as fileObj:
+            index = json.load(fileObj)
+    except ValueError:
+        return dict()
+    return index.get('files', dict()) if index.get('version', 0) <= INDEX_VERSION else dict()
+
+def updateIndex(directory, filePaths, numVertices=None):
+    '''Describe the given skin files in the directory index, written atomically. Return the index entries.
+    numVertices {file path: vertex count} spares counting the lines of ".sw" files just written.
+    '''
+    entries = _loadIndex(directory)
+    numVertices = numVertices or dict()
+    for filePath in filePaths:
+        entry = describeSkinFile(filePath, numVertices.get(filePath))
+        entries[entry['file']] = entry
+    _writeIndex(directory, entries)
+    return entries
+
+def readIndex(directory, names=None):
+    '''Return {file name: entry} of the skin files of a directory.
+    Entries of new or modified files are described again and the index rewritten, entries of deleted files dropped.
+    When mesh names are given only their files are described, other entries are returned as they are.
+    '''
+    entries, changed = _loadIndex(directory), False
+    found = [ f for f in os.listdir(directory) if os.path.splitext(f)[-1] in INDEX_EXTS ]
+    wanted = found if names is None else [ f for f in found if os.path.splitext(f)[0] in set(names) ]
+    for fileName in wanted:
+        stat = os.stat(os.path.join(directory, fileName))
+        entry = entries.get(fileName)
+        if not entry or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entries[fileName] = describeSkinFile(os.path.join(directory, fileName))
+            changed = True
+    for fileName in set(entries) - set(found):
+        del entries[fileName]
+        changed = True
+
+    if changed:
+        try:
+            _writeIndex(directory, entries)
+        except (IOError, OSError):
+            pass  # read only library, the index is only a cache
+    return entries
+
+def findSkinEntry(entries, name):
+    '''Return the entry of the newest skin file of a mesh name, or None. A mesh saved again in another format
+    keeps its older files, so the latest save wins, INDEX_EXTS order breaking ties.
+    '''
+    found = [ (entries[name + ext]['mtime'], -x, entries[name + ext]) for x, ext in enumerate(INDEX_EXTS)
+              if entries.get(name + ext) ]
+    return max(found, key=lambda item: item[:2])[2] if found else None
+
+def findSkinFile(directory, name):
+    '''Return the path of the newest skin file of a mesh name in a directory, without the index, or None.'''
+    found = [ (os.path.getmtime(os.path.join(directory, name + ext)), -x, os.path.join(directory, name + ext))
+              for x, ext in enumerate(INDEX_EXTS) if os.path.exists(os.path.join(directory, name + ext)) ]
+    return max(found)[2] if found else None
+
+def checkSkinEntry(entry, numVertex, topologyHash=b''):
+    '''Return why an index entry does not fit a mesh, or None when it does.'''
+    if entry['numVertex'] != numVertex:
+        return 'vertex count {} instead of {}'.format(entry['numVertex'], numVertex)
+    if entry['topologyHash'] and topologyHash and entry['topologyHash'] != topologyHash.hex():
+        return 'topology does not match'
+    return None
@@ -0,0 +1,132 @@
+import os
+import re
+import time
+
+import numpy as np
+
+from GZ_utils import skinFileUtils as sfu
+from GZ_utils import weightUtils as wtu
+
+# a snapshot directory "<mesh>.swsnap" holds a chain of ".swb" checkpoints: "0000.swb" is the base with every
+# vertex, each next file only holds the rows changed since the checkpoint before it, with its influence list.
+SNAPSHOT_EXT = '.swsnap'
+SNAPSHOT_TOLERANCE = 1e-4
+CHECKPOINT_RE = re.compile(r'^(\d+)' + re.escape(sfu.BINARY_EXT) + '$')
+# a chain made for another vertex count or topology is moved to "history/<time stamp>" instead of being deleted
+HISTORY_DIR = 'history'
+
+def snapshotDirectory(directory, meshName):
+    return os.path.join(directory, meshName + SNAPSHOT_EXT)
+
+def _checkpointPath(snapDir, checkpoint):
+    return os.path.join(snapDir, '{:04d}{}'.format(checkpoint, sfu.BINARY_EXT))
+
+def _writeAtomic(filePath, data, quantize=False):
+    '''Write a SkinData next to filePath then move it in place, readers never see a partial file.'''
+    tmpPath = filePath + '.tmp'
+    sfu.writeBinarySkin(tmpPath, data, quantize=quantize)
+    os.replace(tmpPath, filePath)
+    return filePath
+
+def listCheckpoints(snapDir):
+    '''Return the checkpoint files of a snapshot directory, base first.'''
+    if not os.path.isdir(snapDir):
+        return []
+    found = [ CHECKPOINT_RE.match(f) for f in os.listdir(snapDir) ]
+    return [ _checkpointPath(snapDir, n) for n in sorted(int(m.group(1)) for m in found if m) ]
+
+def archiveCheckpoints(snapDir):
+    '''Move the checkpoint chain of a snapshot directory into a new time stamped history directory. Return it.'''
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    archiveDir = os.path.join(snapDir, HISTORY_DIR, stamp)
+    count = 1
+    while os.path.exists(archiveDir):
+        archiveDir = os.path.join(snapDir, HISTORY_DIR, '{}_{}'.format(stamp, count))
+        count += 1
+    os.makedirs(archiveDir)
+    for filePath in listCheckpoints(snapDir):
+        os.replace(filePath, os.path.join(archiveDir, os.path.basename(filePath)))
+    return archiveDir
+
+def restoreSnapshot(snapDir, checkpoint=None, vertices=None):
+    '''Return the SkinData of a checkpoint, the last one by default.
+
+    The base file is memory mapped and the deltas up to the checkpoint are replayed over it.
+    If vertices is given only those rows are read and returned.
+    '''
+    files = listCheckpoints(snapDir)
+    if checkpoint is not None:
+        if not 0 <= checkpoint < len(files):
+            raise ValueError('Checkpoint {} not found in "{}".'.format(checkpoint, snapDir))
+        files = files[:checkpoint + 1]
+    if not files:
+        raise ValueError('"{}" holds no skin snapshot.'.format(snapDir))
+
+    base = sfu.readBinarySkinRows(files[0], vertices)
+    if vertices is None:
+        selected = np.arange(base.numVertex)
+    else:
+        selected = np.unique(np.asarray(vertices, dtype=np.int64))
+        selected = selected[(selected >= 0) & (selected < base.numVertex)]
+    rowOf = np.zeros(base.numVertex, dtype=np.int64)
+    rowOf[selected] = np.arange(len(selected))
+
+    # every delta row replaces the whole vertex row, columns follow the union of the influence lists seen
+    influences = columns = list(base.influences)
+    weights = np.zeros((len(selected), len(columns)), dtype=np.float64)
+    weights[rowOf[base.vertices]] = base.toDense()
+    for filePath in files[1:]:
+        delta = sfu.readBinarySkinRows(filePath, selected)
+        union = columns + [ inf for inf in delta.influences if inf not in columns ]
+        if union != columns:
+            weights = wtu.remapInfluences(weights, columns, union)
+        weights[rowOf[delta.vertices]] = wtu.remapInfluences(delta.toDense(), delta.influences, union)
+        influences, columns = delta.influences, union
+
+    weights = wtu.remapInfluences(weights, columns, influences)
+    return sfu.SkinData.fromDense(base.meshName, influences, weights, selected, base.numVertex, base.topologyHash)
+
+def writeSnapshot(directory, meshName, influences, weights, topologyHash=b'', tolerance=SNAPSHOT_TOLERANCE,
+                  quantize=False):
+    '''Add a checkpoint of a weight matrix (vertex x influence) to the snapshot of a mesh. Return its file.
+
+    Only the rows differing from the last checkpoint by more than tolerance are written. A new base is
+    started when there is no snapshot yet or when the vertex count or the topology changed, the old chain
+    being kept in a history directory (see archiveCheckpoints).
+    '''
+    snapDir = snapshotDirectory(directory, meshName)
+    weights = np.asarray(weights, dtype=np.float64)
+    files = listCheckpoints(snapDir)
+
+    if files:
+        previous = restoreSnapshot(snapDir)
+        if previous.numVertex != len(weights) or previous.topologyHash != topologyHash:
+            archiveDir = archiveCheckpoints(snapDir)
+            print('"{}" vertex count or topology changed, previous snapshot moved to "{}".'.format(meshName,
+                                                                                                   archiveDir))
+            files = []
+
+    if not files:
+        if not os.path.isdir(snapDir):
+            os.makedirs(snapDir)
+        data = sfu.SkinData.fromDense(meshName, influences, weights, topologyHash=topologyHash)
+        return _writeAtomic(_checkpointPath(snapDir, 0), data, quantize)
+
+    union = previous.influences + [ inf for inf in influences if inf not in previous.influences ]
+    diff = wtu.remapInfluences(weights, influences, union) - \
+           wtu.remapInfluences(previous.toDense(), previous.influences, union)
+    changed = np.flatnonzero(np.abs(diff).max(axis=1) > tolerance) if union else np.zeros(0, dtype=np.int64)
+
+    data = sfu.SkinData.fromDense(meshName, influences, weights[changed], changed, len(weights), topologyHash)
+    checkpoint = int(CHECKPOINT_RE.match(os.path.basename(files[-1])).group(1)) + 1
+    return _writeAtomic(_checkpointPath(snapDir, checkpoint), data, quantize)
+
+def compactSnapshot(snapDir, quantize=False):
+    '''Fold the checkpoint chain of a snapshot directory into a single base file. Return its file.'''
+    files = listCheckpoints(snapDir)
+    data = restoreSnapshot(snapDir)
+    # replaying the old deltas over the new base gives the same weights, so a crash in between is harmless
+    basePath = _writeAtomic(files[0], data, quantize)
+    for filePath in files[1:]:
+        os.remove(filePath)
+    return basePath
@@ -0,0 +1,156 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+
+import numpy as np
+
+from GZ_utils import skinFileUtils as sfu
+
+# content addressed skin store: a "<mesh>.swc" json manifest per mesh lists the chunks holding its weights,
+# chunks live once in "chunks/<2 hex>/<sha1>" next to the manifests, zlib compressed.
+# A weight chunk covers CHUNK_ROWS rows: influence counts (uint16), influence columns (uint16), weights (float32).
+# Vertex ids are only stored, as uint32 chunks, when the rows are not every vertex in order.
+STORE_EXT = '.swc'
+STORE_VERSION = 1
+CHUNK_DIR = 'chunks'
+CHUNK_ROWS = 4096
+
+def _chunkPath(directory, key):
+    return os.path.join(directory, CHUNK_DIR, key[:2], key)
+
+def _writeFile(filePath, content):
+    '''Write next to filePath then move it in place, so readers and other writers never see a partial file.'''
+    tmpPath = '{}.{}.{}.tmp'.format(filePath, os.getpid(), threading.current_thread().ident)
+    with open(tmpPath, 'wb') as fileObj:
+        fileObj.write(content)
+    os.replace(tmpPath, filePath)
+
+def putChunk(directory, blob):
+    '''Store a chunk unless the store has it already. Return its key.'''
+    key = hashlib.sha1(blob).hexdigest()
+    chunkPath = _chunkPath(directory, key)
+    if not os.path.exists(chunkPath):
+        if not os.path.isdir(os.path.dirname(chunkPath)):
+            os.makedirs(os.path.dirname(chunkPath), exist_ok=True)
+        _writeFile(chunkPath, zlib.compress(blob, 1))
+    return key
+
+def getChunk(directory, key):
+    with open(_chunkPath(directory, key), 'rb') as fileObj:
+        blob = zlib.decompress(fileObj.read())
+    if hashlib.sha1(blob).hexdigest() != key:
+        raise ValueError('Skin store chunk "{}" is corrupted.'.format(key))
+    return blob
+
+def writeStoreSkin(filePath, meshName, influences, weights, topologyHash=b''):
+    '''Write a weight matrix (vertex x influence) to the store of the directory of filePath, a ".swc" manifest.
+    Chunks the store has already are not written again. Return filePath.
+    '''
+    data = sfu.SkinData.fromDense(meshName, influences, weights, topologyHash=topologyHash)
+    return writeStoreData(filePath, data)
+
+def writeStoreData(filePath, data):
+    '''Write a SkinData to the store of the directory of filePath, a ".swc" manifest. Return filePath.'''
+    directory = os.path.dirname(filePath)
+    offsets = np.asarray(data.offsets, dtype=np.int64)
+    counts = np.diff(offsets).astype(np.uint16)
+    indices = np.asarray(data.indices, dtype=np.uint16)
+    values = np.asarray(data.values, dtype=np.float32)
+    vertices = np.asarray(data.vertices, dtype=np.uint32)
+
+    chunks, vertexChunks = [], None
+    for start in range(0, len(vertices), CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, len(vertices))
+        first, last = offsets[start], offsets[end]
+        blob = counts[start:end].tobytes() + indices[first:last].tobytes() + values[first:last].tobytes()
+        chunks.append(putChunk(directory, blob))
+
+    if not np.array_equal(vertices, np.arange(len(vertices))):
+        vertexChunks = [ putChunk(directory, vertices[start:start + CHUNK_ROWS].tobytes())
+                         for start in range(0, len(vertices), CHUNK_ROWS) ]
+
+    manifest = dict(version=STORE_VERSION, meshName=data.meshName, influences=list(data.influences),
+                    numVertex=int(data.numVertex), topologyHash=data.topologyHash.hex(), rows=len(vertices),
+                    chunkRows=CHUNK_ROWS, chunks=chunks, vertices=vertexChunks)
+    _writeFile(filePath, json.dumps(manifest, indent=1).encode('utf-8'))
+    return filePath
+
+def readManifest(filePath):
+    with open(filePath, 'rb') as fileObj:
+        manifest = json.loads(fileObj.read().decode('utf-8'))
+    if manifest.get('version', 0) > STORE_VERSION:
+        raise ValueError('Skin store manifest version {} is not supported.'.format(manifest['version']))
+    return manifest
+
+def readStoreSkin(filePath, vertices=None):
+    '''Rebuild the SkinData of a ".swc" manifest from the store chunks.
+    If vertices is given only the chunks holding their rows are read.
+    '''
+    directory = os.path.dirname(filePath)
+    manifest = readManifest(filePath)
+    numRows, chunkRows = manifest['rows'], manifest['chunkRows']
+
+    if manifest['vertices'] is None:
+        fileVertices = np.arange(numRows, dtype=np.uint32)
+    else:
+        fileVertices = np.frombuffer(b''.join(getChunk(directory, key) for key in manifest['vertices']),
+                                     dtype=np.uint32)
+    if vertices is None:
+        rows = np.arange(numRows)
+    else:
+        rows, _ = sfu.findRows(fileVertices, vertices)
+        rows = np.sort(rows)
+
+    parts = []
+    for c in np.unique(rows // chunkRows):
+        blob = getChunk(directory, manifest['chunks'][c])
+        size = min(chunkRows, numRows - c * chunkRows)
+        counts = np.frombuffer(blob, dtype=np.uint16, count=size).astype(np.int64)
+        nnz = int(counts.sum())
+        indices = np.frombuffer(blob, dtype=np.uint16, count=nnz, offset=size * 2)
+        values = np.frombuffer(blob, dtype=np.float32, count=nnz, offset=size * 2 + nnz * 2)
+
+        chunkOffsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(counts, out=chunkOffsets[1:])
+        local = rows[(rows >= c * chunkRows) & (rows < c * chunkRows + size)] - c * chunkRows
+        starts, lengths = chunkOffsets[local], counts[local]
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        parts.append((lengths, indices[positions], values[positions]))
+
+    if parts:
+        lengths, indices, values = [ np.concatenate(p) for p in zip(*parts) ]
+    else:
+        lengths, indices, values = np.zeros(0, np.int64), np.zeros(0, np.uint16), np.zeros(0, np.float32)
+    offsets = np.zeros(len(rows) + 1, dtype=np.uint32)
+    np.cumsum(lengths, out=offsets[1:])
+
+    return sfu.SkinData(manifest['meshName'], manifest['influences'], fileVertices[rows].astype(np.uint32),
+                        offsets, indices, values, manifest['numVertex'], bytes.fromhex(manifest['topologyHash']))
+
+def readSkinFile(filePath, vertices=None):
+    '''Read a skin file of any format, only the rows of the given vertex ids if any. Return a SkinData.'''
+    if os.path.splitext(filePath)[-1] == STORE_EXT:
+        return readStoreSkin(filePath, vertices)
+    if vertices is None:
+        return sfu.readSkin(filePath)
+    return sfu.readSkinRows(filePath, vertices)
+
+def collectGarbage(directory):
+    '''Delete the chunks no ".swc" manifest of the directory uses anymore. Return the number deleted.'''
+    used = set()
+    for fileName in os.listdir(directory):
+        if os.path.splitext(fileName)[-1] == STORE_EXT:
+            manifest = readManifest(os.path.join(directory, fileName))
+            used.update(manifest['chunks'])
+            used.update(manifest['vertices'] or [])
+
+    removed = 0
+    chunkDir = os.path.join(directory, CHUNK_DIR)
+    for root, dirs, files in os.walk(chunkDir):
+        for key in files:
+            if key not in used and not key.endswith('.tmp'):
+                os.remove(os.path.join(root, key))
+                removed += 1
+    return removed
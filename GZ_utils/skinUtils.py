@@ -1,8 +1,96 @@
 import os
-from maya import mel
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from maya import cmds
 import pymel.core as pm
 from maya.OpenMaya import MGlobal
+from maya.api import OpenMaya as om
+from maya.api import OpenMayaAnim as oma
+
+from GZ_utils import skinFileUtils as sfu
+from GZ_utils import skinSnapshotUtils as ssu
+from GZ_utils import skinStoreUtils as sst
+from GZ_utils import skinIndexUtils as sxu
+from GZ_utils import skinDiffUtils as sdu
+from GZ_utils import weightUtils as wtu
+from GZ_utils import meshUtils as msh
+from GZ_utils.progressUtils import ProgressReporter
+
+SKIN_WEIGHTS_PLUGIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'GZ_plugins', 'skin_weights_cmd.py')
+CSR_SKIN_PLUGIN = os.path.join(os.path.dirname(SKIN_WEIGHTS_PLUGIN), 'csr_skin_deformer.py')
+PENDING_WEIGHTS = dict()
+EXPORT_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+SKIN_CLUSTER_CACHE = {}
+SCENE_CALLBACKS = []
+
+def _findSkinCluster(shapeObj):
+    '''Walk the history of a shape and return the skinCluster MObject writing into it, or None.'''
+    it = om.MItDependencyGraph(shapeObj, om.MFn.kSkinClusterFilter, om.MItDependencyGraph.kUpstream,
+                               om.MItDependencyGraph.kDepthFirst, om.MItDependencyGraph.kNodeLevel)
+    while not it.isDone():
+        skinObj = it.currentNode()
+        outputs = oma.MFnSkinCluster(skinObj).getOutputGeometry()
+        if any(outputs[i] == shapeObj for i in range(len(outputs))):
+            return skinObj
+        it.next()
+    return None
+
+def _invalidateSkinCluster(key):
+    entry = SKIN_CLUSTER_CACHE.pop(key, None)
+    if entry:
+        om.MMessage.removeCallbacks(entry[3])
+
+def _onConnectionChanged(msg, plug, otherPlug, key):
+    if msg & (om.MNodeMessage.kConnectionMade | om.MNodeMessage.kConnectionBroken):
+        _invalidateSkinCluster(key)
+
+def _onNodeRemoved(node, key):
+    _invalidateSkinCluster(key)
+
+def clearSkinClusterCache(*args):
+    '''Forget all cached skinCluster lookups and remove their callbacks.'''
+    for key in list(SKIN_CLUSTER_CACHE):
+        _invalidateSkinCluster(key)
+
+def getSkinCluster(mesh):
+    '''Return (skinCluster name, influence names) of a mesh, or (None, []) if it is not skinned.
+
+    The lookup is cached per shape. An entry is dropped as soon as a connection of the shape
+    or of its skinCluster changes (new deformer, added influence...) or one of them is deleted.
+    '''
+    try:
+        shapeObj = msh.getShapePath(mesh).node()
+    except RuntimeError:
+        return None, []
+
+    shapeHandle = om.MObjectHandle(shapeObj)
+    key = shapeHandle.hashCode()
+    entry = SKIN_CLUSTER_CACHE.get(key)
+    if entry and not (entry[0].isValid() and entry[0].object() == shapeObj):
+        _invalidateSkinCluster(key)
+        entry = None
+
+    if not entry:
+        if not SCENE_CALLBACKS:
+            SCENE_CALLBACKS.extend(om.MSceneMessage.addCallback(msg, clearSkinClusterCache)
+                                   for msg in (om.MSceneMessage.kBeforeNew, om.MSceneMessage.kBeforeOpen))
+        skinObj = _findSkinCluster(shapeObj)
+        nodes = [shapeObj] if skinObj is None else [shapeObj, skinObj]
+        callbacks = []
+        for node in nodes:
+            callbacks.append(om.MNodeMessage.addAttributeChangedCallback(node, _onConnectionChanged, key))
+            callbacks.append(om.MNodeMessage.addNodePreRemovalCallback(node, _onNodeRemoved, key))
+        if skinObj is None:
+            entry = (shapeHandle, None, [], callbacks)
+        else:
+            influences = list(oma.MFnSkinCluster(skinObj).influenceObjects())
+            entry = (shapeHandle, om.MObjectHandle(skinObj), influences, callbacks)
+        SKIN_CLUSTER_CACHE[key] = entry
+
+    if entry[1] is None:
+        return None, []
+    return om.MFnDependencyNode(entry[1].object()).name(), [ path.partialPathName() for path in entry[2] ]
 
 def detectSkin(name='', checkOnly=False):
     if name != '' and pm.objExists(name):
@@ -10,11 +98,9 @@ def detectSkin(name='', checkOnly=False):
     else:
         return MGlobal.displayInfo('"{}" not valid.'.format(name))
 
-    sclst = mel.eval('findRelatedSkinCluster '+mesh.name())
-    if pm.objExists(sclst):
+    sclst = getSkinCluster(mesh.name())[0]
+    if sclst:
         sclst = pm.PyNode(sclst)
-    else:
-        sclst = None
 
     if checkOnly:
         if sclst != None:
@@ -28,17 +114,190 @@ def getInfluencesFromSel():
     '''Get all influences from all selected skinned meshes'''
     influences = []
     for s in cmds.ls(sl=True):
-        sclst = mel.eval('findRelatedSkinCluster {};'.format(s))
+        sclst = getSkinCluster(s)[0]
+        if not sclst: continue
         influ = cmds.skinCluster(sclst, q=True, weightedInfluence=True)
         for i in influ:
             if i not in influences: influences.append(i)
     return influences
 
+def getSkinFn(skinCluster):
+    '''Return the MFnSkinCluster of a skinCluster and the dag path of its deformed shape.'''
+    selection = om.MSelectionList()
+    selection.add(str(skinCluster))
+    fnSkin = oma.MFnSkinCluster(selection.getDependNode(0))
+    shapePath = om.MDagPath.getAPathTo(fnSkin.getOutputGeometry()[0])
+    return fnSkin, shapePath
+
+def getInfluences(skinCluster):
+    '''Return the influence names of a skinCluster, in the order of its weight columns.'''
+    fnSkin, shapePath = getSkinFn(skinCluster)
+    return [ path.partialPathName() for path in fnSkin.influenceObjects() ]
+
+def addMissingInfluences(sclst, influences):
+    '''Add the influences a skinCluster (PyNode) misses with zero weight. Return all its influences.'''
+    allInfluences = getInfluences(sclst.name())
+    notInf = [ inf for inf in influences if inf not in allInfluences ]
+    if notInf:
+        sclst.addInfluence(notInf, lockWeights=True, weight=0)
+        for i in notInf: pm.PyNode(i).lockInfluenceWeights.set(False)
+        allInfluences = getInfluences(sclst.name())
+    return allInfluences
+
+def getLockedInfluences(influences):
+    '''Return the lockInfluenceWeights state of influences as a bool array.'''
+    return np.array([ bool(cmds.objExists(inf + '.liw') and cmds.getAttr(inf + '.liw')) for inf in influences ],
+                    dtype=bool)
+
+def getVertexComponent(shapePath, vertices=None):
+    '''Return a vertex component of the whole mesh, or of the given vertex ids only.'''
+    fnComp = om.MFnSingleIndexedComponent()
+    component = fnComp.create(om.MFn.kMeshVertComponent)
+    if vertices is None:
+        fnComp.setCompleteData(om.MFnMesh(shapePath).numVertices)
+    else:
+        fnComp.addElements([int(i) for i in vertices])
+    return component
+
+def getSkinWeights(skinCluster, vertices=None):
+    '''Read all weights of a skinCluster with a single MFnSkinCluster.getWeights call.
+
+    Return (influences, weights), weights being a numpy array of shape (vertex, influence).
+    If vertices is given only those rows are read, sorted and without duplicates.
+    '''
+    fnSkin, shapePath = getSkinFn(skinCluster)
+    if vertices is not None:
+        vertices = np.unique(np.asarray(vertices, dtype=np.int64))
+    component = getVertexComponent(shapePath, vertices)
+
+    weights, numInfluence = fnSkin.getWeights(shapePath, component)
+    influences = [ path.partialPathName() for path in fnSkin.influenceObjects() ]
+    weights = np.array(weights, dtype=np.float64).reshape(-1, numInfluence)
+
+    return influences, weights
+
+def setSkinWeights(skinCluster, weights, influences=None, vertices=None, normalize=True):
+    '''Write a weight matrix (vertex x influence) to a skinCluster with a single MFnSkinCluster.setWeights call.
+
+    influences are the names of the weights columns, by default all influences of the skinCluster.
+    vertices are the ids of the weights rows, by default all vertices of the mesh.
+    The write goes through the gzSetSkinWeights command so it is one undo step.
+    '''
+    fnSkin, shapePath = getSkinFn(skinCluster)
+    allInfluences = [ path.partialPathName() for path in fnSkin.influenceObjects() ]
+    influences = allInfluences if influences is None else list(influences)
+    missing = [ inf for inf in influences if inf not in allInfluences ]
+    if missing:
+        return MGlobal.displayError('{} not influence of "{}".'.format(', '.join(missing), skinCluster))
+
+    weights = np.asarray(weights, dtype=np.float64)
+    if normalize:
+        weights = wtu.normalizeWeights(weights)
+    if vertices is not None:
+        vertices, rows = np.unique(np.asarray(vertices, dtype=np.int64), return_index=True)
+        weights = weights[rows]
+    component = getVertexComponent(shapePath, vertices)
+
+    influenceIds = om.MIntArray([ allInfluences.index(inf) for inf in influences ])
+    if not cmds.pluginInfo(os.path.basename(SKIN_WEIGHTS_PLUGIN), query=True, loaded=True):
+        cmds.loadPlugin(SKIN_WEIGHTS_PLUGIN, quiet=True)
+    # single slot, emptied whatever happens so a failed call never leaks its weights into the next one
+    PENDING_WEIGHTS['weights'] = (fnSkin, shapePath, component, influenceIds,
+                                  om.MDoubleArray(weights.ravel().tolist()))
+    try:
+        cmds.gzSetSkinWeights()
+    finally:
+        PENDING_WEIGHTS.clear()
+
+def cleanSkinWeights(threshold=0.001, maxInfluences=4):
+    '''Prune weights below threshold and limit the influences per vertex of the selected skinned meshes.
+    Locked influences keep their weights. Only the changed vertices are written, as one undo step.
+    '''
+    meshesD = getSkinnedMeshes()
+    if not meshesD:
+        return MGlobal.displayInfo('Please select skinned mesh to clean the skinweight.')
+
+    cmds.undoInfo(openChunk=True, chunkName='cleanSkinWeights')
+    try:
+        for meshName, skinClusterName in meshesD.items():
+            influences, weights = getSkinWeights(skinClusterName)
+            weights, report = wtu.cleanWeights(weights, threshold, maxInfluences, getLockedInfluences(influences))
+            vertices = report['vertices']
+            if len(vertices):
+                setSkinWeights(skinClusterName, weights[vertices], influences, vertices, normalize=False)
+            print('{}: {} vertices changed, {} weights pruned, {} over max influences, max change {:.4f}.'.format(
+                meshName, len(vertices), report['pruned'], report['limited'], report['maxChange']))
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+    MGlobal.displayInfo('Clean skin weights done.')
+
+def smoothSkinWeights(iterations=3, strength=0.5, taubin=False):
+    '''Smooth the weights of the selected vertices, or of whole selected meshes, over the mesh edges.
+    taubin alternates shrink and inflate steps to keep weight borders in place. Locked influences are untouched.
+    '''
+    verticesD = dict()
+    for s in pm.selected():
+        if type(s) == pm.general.MeshVertex:
+            verticesD.setdefault(s.node().getParent().name(), []).extend(s.indices())
+        elif getSkinCluster(s.name())[0]:
+            verticesD[s.name()] = None
+    if not verticesD:
+        return MGlobal.displayInfo('Please select skinned mesh or vertices to smooth the skinweight.')
+
+    cmds.undoInfo(openChunk=True, chunkName='smoothSkinWeights')
+    try:
+        for meshName, vertices in verticesD.items():
+            skinClusterName = getSkinCluster(meshName)[0]
+            if not skinClusterName:
+                MGlobal.displayWarning('"{}" is not skinned, skipped.'.format(meshName))
+                continue
+            influences, weights = getSkinWeights(skinClusterName)
+            rows = np.arange(len(weights)) if vertices is None else np.unique(vertices)
+            weights = wtu.smoothWeights(weights, msh.getAdjacency(meshName), iterations, strength, rows, taubin,
+                                        locked=getLockedInfluences(influences))
+            setSkinWeights(skinClusterName, weights[rows], influences, rows, normalize=False)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+    MGlobal.displayInfo('Smooth skin weights done.')
+
+def mirrorSkinWeights(axis=0, positive=True, tolerance=1e-3):
+    '''Mirror the weights of the selected skinned meshes across the world plane normal to axis, lt_/rt_ influences
+    swapped. positive copies the positive side onto the negative side, otherwise the other way.
+    The mesh should be in bind pose.
+    '''
+    meshesD = getSkinnedMeshes()
+    if not meshesD:
+        return MGlobal.displayInfo('Please select skinned mesh to mirror the skinweight.')
+
+    cmds.undoInfo(openChunk=True, chunkName='mirrorSkinWeights')
+    try:
+        for meshName, skinClusterName in meshesD.items():
+            mirrorMap = msh.getSymmetryMap(meshName, axis, tolerance)
+            side = msh.getPoints(meshName)[:, axis] * (1 if positive else -1)
+            targets = np.flatnonzero(side < -tolerance)
+            missing = np.count_nonzero(mirrorMap[targets] < 0)
+            if missing:
+                MGlobal.displayWarning('{} vertices of "{}" have no mirror within {}, they are left as they are.'.format(
+                    missing, meshName, tolerance))
+            targets = targets[mirrorMap[targets] >= 0]
+
+            mirrored = [ wtu.mirrorInfluenceName(inf) for inf in getSkinCluster(meshName)[1] ]
+            addMissingInfluences(pm.PyNode(skinClusterName), [ inf for inf in mirrored if cmds.objExists(inf) ])
+            influences, weights = getSkinWeights(skinClusterName)
+            weights = wtu.mirrorWeights(weights, influences, mirrorMap, targets)
+            setSkinWeights(skinClusterName, weights[targets], influences, targets)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+    MGlobal.displayInfo('Mirror skin weights done.')
+
 def copySkinWeight(source=None, destination=None, vtxID=False):
     sel = pm.selected()
     if sel and len(sel) == 2: source, destination = sel
 
-    selVtxID = []
+    selVtxID, meshVertex = [], []
     if pm.objExists(source): source = pm.PyNode(source)
     if pm.objExists(destination): destination = pm.PyNode(destination)
 
@@ -59,58 +318,126 @@ def copySkinWeight(source=None, destination=None, vtxID=False):
         src = source
         dst = destination
 
+    if vtxID and msh.getTopologyHash(src.name()) != msh.getTopologyHash(dst.name()):
+        return MGlobal.displayError('"{}" and "{}" topology differ, cannot copy skin weight per vertex ID.'.format(src, dst))
+
     sclst_src = detectSkin(src)
     sclst_dst = detectSkin(dst)
     if not sclst_dst:
         sclst_dst = pm.skinCluster(sclst_src.getInfluence(), dst, tsb=True)
         sclst_dst.rename( 'sclst_'+dst.name() )
 
-    inf_src = sclst_src.getInfluence()
-    inf_dst = sclst_dst.getInfluence()
-
     # add influence first if influence in source is not in destination
-    notInf = []
-    for inf in inf_src:
-        if inf not in inf_dst:
-            notInf.append(inf)
-    if notInf:
-        sclst_dst.addInfluence(notInf, lockWeights=True, weight=0)
-        for i in notInf: i.lockInfluenceWeights.set(False)
+    influences_dst = addMissingInfluences(sclst_dst, [ str(inf) for inf in sclst_src.getInfluence() ])
 
     if not vtxID:
         ia = ['name','oneToOne','closestJoint']
         pm.copySkinWeights(ss=sclst_src, ds=sclst_dst, noMirror=True, influenceAssociation=ia)
         MGlobal.displayInfo('Copy skin weight from "{}" to "{}".'.format(src, dst))
     else:
-        src_numOfVertex = cmds.polyEvaluate(src.name(), vertex=True)
-        dst_numOfVertex = cmds.polyEvaluate(dst.name(), vertex=True)
-        max = src_numOfVertex
-        if meshVertex: max = len(selVtxID)
-
-        gMainProgressBar = mel.eval('$tmp = $gMainProgressBar')
-        cmds.progressBar(gMainProgressBar, edit=True, beginProgress=True, isInterruptable=False, maxValue=max,
-                         status='Copying skin from "{}" to "{}"...'.format(src, dst))
-
-        for i in range(src_numOfVertex):
-            if i <= dst_numOfVertex and i in selVtxID:
-                src_vtxName = '%s.vtx[%d]' % (src.name(), i)
-                dst_vtxName = '%s.vtx[%d]' % (dst.name(), i)
-                trans = cmds.skinPercent(sclst_src.name(), src_vtxName, query=True, transform=None)
-                jValue = []
-                for t in trans:
-                    weight = cmds.skinPercent(sclst_src.name(), src_vtxName, transform=t, normalize=False, query=True)
-                    valList = (t, weight)
-                    jValue.append(valList)
-
-                cmds.skinPercent(sclst_dst.name(), dst_vtxName, normalize=True, transformValue=jValue)
+        # whole matrices, source columns remapped once by name to the destination influences
+        influences_src, weights = getSkinWeights(sclst_src.name())
+        weights = wtu.remapInfluences(weights, influences_src, influences_dst)
 
-                cmds.progressBar(gMainProgressBar, edit=True, step=1)
-
-        cmds.progressBar(gMainProgressBar, edit=True, endProgress=True)
+        vertices = np.unique(np.asarray(selVtxID, dtype=np.int64)) if meshVertex else np.arange(len(weights))
+        setSkinWeights(sclst_dst.name(), weights[vertices], influences_dst, vertices)
 
         MGlobal.displayInfo('Copy skin weight from "{}" to "{}" per vertex ID done.'.format(src, dst))
 
-def saveSkin(checkName=False):
+def transferSkinWeights(source=None, destinations=None):
+    '''Copy skin weights from source to destination meshes of any topology, by closest point on surface.
+
+    Each destination vertex gets the weights of its closest point on the source triangles, blended from the
+    three corners with barycentric coordinates. The source triangle index is cached, so transferring one
+    body to many garments only builds it once.
+    '''
+    sel = cmds.ls(sl=True)
+    if not source and len(sel) >= 2:
+        source, destinations = sel[0], sel[1:]
+    if not source or not destinations:
+        return MGlobal.displayInfo('Select skinned source mesh and then destination meshes to transfer skin.')
+
+    sclst_src = detectSkin(source)
+    if not sclst_src:
+        return MGlobal.displayError('"{}" is not skinned.'.format(source))
+    influences, weights = getSkinWeights(sclst_src.name())
+    index = msh.getTriangleIndex(source)
+
+    with ProgressReporter(len(destinations), 'Transfer skin from "{}"...'.format(source)) as progress:
+        for dst in destinations:
+            progress.setStatus('Transfer skin from "{}" to "{}"...'.format(source, dst))
+            sclst_dst = detectSkin(dst)
+            if not sclst_dst:
+                sclst_dst = pm.skinCluster(influences, dst, tsb=True)
+                sclst_dst.rename('sclst_' + str(dst))
+
+            # add influence first if influence in source is not in destination
+            influences_dst = addMissingInfluences(sclst_dst, influences)
+
+            triangles, bary, distance = index.closest(msh.getPoints(dst))
+            dstWeights = wtu.remapInfluences(index.interpolate(weights, triangles, bary), influences, influences_dst)
+            setSkinWeights(sclst_dst.name(), dstWeights, influences_dst)
+            if not progress.step(): break
+
+    MGlobal.displayInfo('Transfer skin weight from "{}" to {} meshes done.'.format(source, len(destinations)))
+
+def exportSkin(meshesD, path, binary=True, quantize=False, workers=EXPORT_WORKERS, store=False, threshold=0.0,
+               maxInfluences=0):
+    '''Write the skin file of every {meshName: skinClusterName} item to path. Return the written files.
+    store writes to the content addressed store of path instead, where identical weight chunks are kept once.
+    threshold and maxInfluences clean the saved weights (see weightUtils.cleanWeights), the scene is untouched.
+
+    Weights are gathered on the main thread, as the Maya API needs, while a thread pool converts and writes
+    the files of the meshes gathered already. At most workers gathered meshes wait for their write.
+    '''
+    written, pending, numVertices = [], set(), dict()
+    progress = ProgressReporter(len(meshesD) * 2, 'Save skin...')
+    progress.begin()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for meshName, skinClusterName in meshesD.items():
+            progress.setStatus('Save skin for "{}"'.format(meshName))
+            name = str(pm.PyNode(meshName).stripNamespace())
+            influences, weights = getSkinWeights(skinClusterName)
+            if threshold > 0 or maxInfluences > 0:
+                weights, report = wtu.cleanWeights(weights, threshold, maxInfluences, getLockedInfluences(influences))
+                print('{}: {} weights pruned, {} over max influences.'.format(meshName, report['pruned'],
+                                                                              report['limited']))
+            topologyHash = msh.getTopologyHash(meshName) if binary or store else b''
+            if not progress.step(): break
+
+            if store:
+                filePath = path + '/' + name + sst.STORE_EXT
+                pending.add(pool.submit(sst.writeStoreSkin, filePath, name, influences, weights, topologyHash))
+            else:
+                filePath = path + '/' + name + (sfu.BINARY_EXT if binary else sfu.LEGACY_EXT)
+                pending.add(pool.submit(sfu.writeSkin, filePath, name, influences, weights, binary, quantize,
+                                        topologyHash))
+            numVertices[filePath] = len(weights)
+            while len(pending) > workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                written += [ future.result() for future in done ]
+                progress.step(len(done))
+
+        for future in as_completed(pending):
+            written.append(future.result())
+            progress.step()
+    finally:
+        pool.shutdown(wait=True)
+        progress.end()
+
+    if written:
+        sxu.updateIndex(path, written, numVertices)
+
+    print('Skin weight of {} meshes has been saved successfully.'.format(len(written)))
+    return written
+
+def saveSkin(checkName=False, binary=True, quantize=False, store=False, threshold=0.0, maxInfluences=0):
+    '''Save the skin weights of the selected meshes, one file per mesh.
+    binary writes the ".swb" format (quantize stores uint16 weights), otherwise the ".sw" text format.
+    store writes ".swc" manifests of the deduplicated skin store instead.
+    threshold prunes smaller weights and maxInfluences limits the influences per vertex of the saved weights.
+    '''
     meshes = [m for m in pm.ls(sl=True, type=['transform', 'mesh']) if m.getShape() and m.getShape().type() == 'mesh']
     if not meshes:
         MGlobal.displayInfo('Please select skinned mesh to save.')
@@ -147,32 +474,8 @@ def saveSkin(checkName=False):
 
     # start export skin
     MGlobal.displayInfo('Start export skin!')
-    gMainProgressBar = mel.eval('$tmp = $gMainProgressBar')
-    for meshName, skinClusterName in meshesD.items():
-        mesh = pm.PyNode(meshName)
-        numOfVertex = cmds.polyEvaluate(meshName, vertex=True)
-        infJoints = cmds.skinCluster(skinClusterName, query=True, influence=True)
-        fileObj = open(path + '/{}.sw'.format(str(mesh.stripNamespace())), 'w')
-
-        cmds.progressBar(gMainProgressBar, edit=True, beginProgress=True, isInterruptable=False, maxValue=numOfVertex,
-                         status='Save skin for "{}"'.format(meshName))
-
-        fileObj.write(str(infJoints) + '\n')
-        for i in range(0, numOfVertex):
-            vtxName = '%s.vtx[%d]' % (meshName, i)
-            trans = cmds.skinPercent(skinClusterName, vtxName, query=True, transform=None)
-            jValue = []
-            for t in trans:
-                weight = cmds.skinPercent(skinClusterName, vtxName, transform=t, normalize=False, query=True)
-                valList = (t, weight)
-                jValue.append(valList)
-            text = '%s,%s\n' % (vtxName.replace(mesh.namespace(), ''), str(jValue))
-            fileObj.write(text)
-
-            cmds.progressBar(gMainProgressBar, edit=True, step=1)
-        cmds.progressBar(gMainProgressBar, edit=True, endProgress=True)
-
-        print('Skin weight of ' + meshName + ' has been saved successfully.')
+    exportSkin(meshesD, path, binary=binary, quantize=quantize, store=store, threshold=threshold,
+               maxInfluences=maxInfluences)
 
     MGlobal.displayInfo('Export skin done!')
 
@@ -195,7 +498,7 @@ def loadSkin(checkName=False, path=None):
         sclst = detectSkin(mesh)
         # print 'detectSkin :',sclst
         if not sclst:
-            meshesD[mesh] = str(mesh.stripNamespace()) + '.sw'
+            meshesD[mesh] = str(mesh.stripNamespace())
         else:
             skinnedMesh.append(mesh.name())
 
@@ -216,47 +519,277 @@ def loadSkin(checkName=False, path=None):
             return
         path = path[0]
 
-    skinDataAvailable = [f for f in os.listdir(path) if '.sw' in f]
-
-    # check if skin data not available
+    # match and validate every mesh with the directory index before reading any weight,
+    # the newest skin file of each mesh is used and only those files are described
+    entries = sxu.readIndex(path, meshesD.values())
     readyMesh, missingMesh = {}, []
-    for mesh, skin in meshesD.items():
-        if skin in skinDataAvailable:
-            readyMesh[mesh] = skin
+    for mesh, name in meshesD.items():
+        entry = sxu.findSkinEntry(entries, name)
+        if not entry:
+            missingMesh.append('{} skin data not found'.format(mesh))
+            continue
+        reason = sxu.checkSkinEntry(entry, om.MFnMesh(msh.getShapePath(mesh.name())).numVertices,
+                                    msh.getTopologyHash(mesh.name()))
+        if reason:
+            missingMesh.append('{} {}'.format(entry['file'], reason))
         else:
-            missingMesh.append(mesh)
+            readyMesh[mesh] = entry['file']
 
     if missingMesh:
-        message = ', '.join(missingMesh) + ' skin data not found, therefore will skipped.'
+        message = ',\n'.join(missingMesh) + '\ntherefore will skipped.'
         choice = cmds.confirmDialog(title='Are you sure?', message=message, button=['Continue', 'Cancel'],
                                     defaultButton='Continue', cancelButton='Cancel', dismissString='Cancel')
         if choice == 'Cancel': return
 
-    # do load skin
-    gMainProgressBar = mel.eval('$tmp = $gMainProgressBar')
-    for mesh, skin in readyMesh.items():
-        # print  mesh, ':', skin
-        meshName = str(mesh.stripNamespace())
-        ns = str(mesh.namespace())
-        skinData = open(path + '/' + skin, 'r')
-
-        content = skinData.readlines()
-        weightVal = content[1:]
-        skinJoints = [mesh.name()] + eval(content[0])
-        skinClusterName = cmds.skinCluster(skinJoints, toSelectedBones=True)[0]
-
-        cmds.progressBar(gMainProgressBar, edit=True, beginProgress=True, isInterruptable=False,
-                         maxValue=len(weightVal),
-                         status='Load skin for "{}"'.format(mesh))
-        for val in weightVal:
-            value = val[:-1].split(',', 1)
-            cmds.skinPercent(skinClusterName, ns + value[0], normalize=True, transformValue=eval(value[1]))
-            cmds.progressBar(gMainProgressBar, edit=True, step=1)
-        cmds.progressBar(gMainProgressBar, edit=True, endProgress=True)
-
-        if 'geo_' in meshName:
-            cmds.rename(skinClusterName, meshName.replace('geo_', 'sclst_'))
-        else:
-            cmds.rename(skinClusterName, 'sclst_' + meshName)
+    # do load skin as one undo chunk, without viewport redraw
+    progress = ProgressReporter(len(readyMesh), 'Load skin...')
+    progress.begin()
+    cmds.undoInfo(openChunk=True, chunkName='loadSkin')
+    cmds.refresh(suspend=True)
+    try:
+        for mesh, skin in readyMesh.items():
+            meshName = str(mesh.stripNamespace())
+            progress.setStatus('Load skin for "{}"'.format(mesh))
+
+            data = sst.readSkinFile(path + '/' + skin)
+            skinClusterName = cmds.skinCluster([mesh.name()] + data.influences, toSelectedBones=True)[0]
+            setSkinWeights(skinClusterName, data.toDense(), data.influences, data.vertices)
+
+            if 'geo_' in meshName:
+                cmds.rename(skinClusterName, meshName.replace('geo_', 'sclst_'))
+            else:
+                cmds.rename(skinClusterName, 'sclst_' + meshName)
+
+            if not progress.step(): break
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+        progress.end()
 
     MGlobal.displayInfo('Load skin data for all selected mesh done.')
+
+def loadSkinOnSelectedVertices(path=None):
+    '''Load skin weights on the selected vertices only, for meshes skinned already.
+
+    ".swb" files are memory mapped and only the rows of the selected vertices are decoded and written.
+    '''
+    verticesD = dict()
+    for vtx in pm.selected():
+        if type(vtx) == pm.general.MeshVertex:
+            verticesD.setdefault(vtx.node().getParent(), []).extend(vtx.indices())
+    if not verticesD:
+        MGlobal.displayInfo('Please select vertices of skinned mesh to load the skinweight.')
+        return
+
+    # define skin directory
+    if not path or not os.path.exists(path):
+        path = cmds.fileDialog2(fileMode=2, okCaption='Load', caption="Load skin directory", ff="*.swb")
+        if not path:
+            MGlobal.displayInfo('Please set load skin directory.')
+            return
+        path = path[0]
+
+    progress = ProgressReporter(len(verticesD), 'Load skin on selected vertices...')
+    progress.begin()
+    cmds.undoInfo(openChunk=True, chunkName='loadSkinOnSelectedVertices')
+    cmds.refresh(suspend=True)
+    try:
+        for mesh, vertices in verticesD.items():
+            if not progress.step(): break
+            name = str(mesh.stripNamespace())
+            skinFile = sxu.findSkinFile(path, name)
+            sclst = detectSkin(mesh.name())
+            if not skinFile or not sclst:
+                MGlobal.displayWarning('"{}" has no skin data or is not skinned, skipped.'.format(mesh))
+                continue
+
+            data = sst.readSkinFile(skinFile, vertices)
+            if data.topologyHash and data.topologyHash != msh.getTopologyHash(mesh.name()):
+                MGlobal.displayWarning('"{}" topology does not match "{}", skipped.'.format(mesh, skinFile))
+                continue
+
+            influences = addMissingInfluences(sclst, data.influences)
+            weights = wtu.remapInfluences(data.toDense(), data.influences, influences)
+            setSkinWeights(sclst.name(), weights, influences, data.vertices)
+            print('Skin weight of {} vertices of {} has been loaded.'.format(len(data.vertices), mesh))
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+        progress.end()
+
+    MGlobal.displayInfo('Load skin data for selected vertices done.')
+
+def getSkinnedMeshes():
+    '''Return {meshName: skinClusterName} of the selected skinned meshes.'''
+    meshesD = dict()
+    for mesh in pm.ls(sl=True, type=['transform', 'mesh']):
+        sclst = getSkinCluster(mesh.name())[0]
+        if sclst: meshesD[mesh.name()] = sclst
+    return meshesD
+
+def getSnapshotDirectory(path=None, caption='Skin snapshot directory'):
+    if path and os.path.exists(path):
+        return path
+    path = cmds.fileDialog2(fileMode=2, caption=caption)
+    return path[0] if path else None
+
+def snapshotSkin(path=None, tolerance=ssu.SNAPSHOT_TOLERANCE, quantize=False):
+    '''Add a checkpoint of the selected skinned meshes to their snapshot, only changed vertices are written.'''
+    meshesD = getSkinnedMeshes()
+    if not meshesD:
+        return MGlobal.displayInfo('Please select skinned mesh to snapshot the skinweight.')
+    path = getSnapshotDirectory(path)
+    if not path:
+        return MGlobal.displayInfo('Please set skin snapshot directory.')
+
+    with ProgressReporter(len(meshesD), 'Snapshot skin...') as progress:
+        for meshName, skinClusterName in meshesD.items():
+            name = str(pm.PyNode(meshName).stripNamespace())
+            influences, weights = getSkinWeights(skinClusterName)
+            filePath = ssu.writeSnapshot(path, name, influences, weights, msh.getTopologyHash(meshName),
+                                         tolerance, quantize)
+            print('Skin snapshot of {} saved to {}.'.format(meshName, filePath))
+            if not progress.step(): break
+
+    MGlobal.displayInfo('Snapshot skin done!')
+
+def restoreSkinSnapshot(path=None, checkpoint=None):
+    '''Set the weights of the selected skinned meshes back to a checkpoint of their snapshot, the last one by default.'''
+    meshesD = getSkinnedMeshes()
+    if not meshesD:
+        return MGlobal.displayInfo('Please select skinned mesh to restore the skinweight.')
+    path = getSnapshotDirectory(path)
+    if not path:
+        return MGlobal.displayInfo('Please set skin snapshot directory.')
+
+    progress = ProgressReporter(len(meshesD), 'Restore skin snapshot...')
+    progress.begin()
+    cmds.undoInfo(openChunk=True, chunkName='restoreSkinSnapshot')
+    cmds.refresh(suspend=True)
+    try:
+        for meshName, skinClusterName in meshesD.items():
+            if not progress.step(): break
+            snapDir = ssu.snapshotDirectory(path, str(pm.PyNode(meshName).stripNamespace()))
+            if not ssu.listCheckpoints(snapDir):
+                MGlobal.displayWarning('"{}" has no skin snapshot, skipped.'.format(meshName))
+                continue
+
+            data = ssu.restoreSnapshot(snapDir, checkpoint)
+            if data.topologyHash and data.topologyHash != msh.getTopologyHash(meshName):
+                MGlobal.displayWarning('"{}" topology does not match "{}", skipped.'.format(meshName, snapDir))
+                continue
+
+            sclst = pm.PyNode(skinClusterName)
+            influences = addMissingInfluences(sclst, data.influences)
+            weights = wtu.remapInfluences(data.toDense(), data.influences, influences)
+            setSkinWeights(sclst.name(), weights, influences, data.vertices)
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+        progress.end()
+
+    MGlobal.displayInfo('Restore skin snapshot done.')
+
+def compactSkinSnapshots(path=None):
+    '''Fold the checkpoints of every snapshot in a directory into a single base file.'''
+    path = getSnapshotDirectory(path)
+    if not path:
+        return MGlobal.displayInfo('Please set skin snapshot directory.')
+
+    snapDirs = [ os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(ssu.SNAPSHOT_EXT) ]
+    for snapDir in snapDirs:
+        if ssu.listCheckpoints(snapDir):
+            ssu.compactSnapshot(snapDir)
+    MGlobal.displayInfo('{} skin snapshots compacted.'.format(len(snapDirs)))
+
+def getSkinSource(source):
+    '''Return the SkinData of a skin file path or of the skinCluster of a mesh name.'''
+    if os.path.isfile(source):
+        return sdu.readWeightFile(source)
+    sclst = getSkinCluster(source)[0]
+    if not sclst:
+        raise ValueError('"{}" is neither a skin file nor a skinned mesh.'.format(source))
+    influences, weights = getSkinWeights(sclst)
+    return sfu.SkinData.fromDense(str(source), influences, weights, topologyHash=msh.getTopologyHash(source))
+
+def showWeightDiff(mesh, report, colorSet='skinWeightDiff'):
+    '''Color the vertices of mesh by their weight change in a color set, blue unchanged to red most changed.'''
+    fnMesh = om.MFnMesh(msh.getShapePath(mesh))
+    if colorSet not in fnMesh.getColorSetNames():
+        fnMesh.createColorSet(colorSet, False)
+    fnMesh.setCurrentColorSetName(colorSet)
+
+    # the (vertex, rgba) table is built in numpy and handed over in one call, no per vertex MColor
+    change = np.clip(np.asarray(report['maxDelta'], dtype=np.float64) / max(report['maxChange'], 1e-12), 0.0, 1.0)
+    colors = np.zeros((fnMesh.numVertices, 4))
+    colors[:, 3] = 1.0
+    colors[report['vertices'], 0] = change[report['vertices']]
+    colors[:, 2] = 1.0 - colors[:, 0]
+    fnMesh.setVertexColors(om.MColorArray(colors.tolist()), om.MIntArray(np.arange(fnMesh.numVertices).tolist()))
+    cmds.setAttr(fnMesh.fullPathName() + '.displayColors', True)
+
+def diffSkin(sourceA, sourceB, tolerance=sdu.DIFF_TOLERANCE, select=True, colorSet=None):
+    '''Compare the weights of two sources, skin files or skinned meshes, and print a summary.
+    select selects the changed vertices and colorSet names a color set showing the change, on the first mesh source
+    or on the selected mesh. Return the diffSkinData report.
+    '''
+    report = sdu.diffSkinData(getSkinSource(sourceA), getSkinSource(sourceB), tolerance)
+    print(sdu.formatDiffReport(report, sourceA, sourceB))
+
+    meshes = [ s for s in (sourceA, sourceB) if not os.path.isfile(s) ] + \
+             [ m.name() for m in pm.ls(sl=True, type=['transform', 'mesh']) ]
+    if meshes and (select or colorSet):
+        shapePath = msh.getShapePath(meshes[0])
+        if select:
+            selection = om.MSelectionList()
+            selection.add((shapePath, getVertexComponent(shapePath, report['vertices'])))
+            om.MGlobal.setActiveSelectionList(selection)
+        if colorSet:
+            showWeightDiff(meshes[0], report, colorSet)
+
+    return report
+
+def arrayData(values, double=False):
+    '''Return an int or double array data object of values, to be set with meshUtils.setPlugData.'''
+    if double:
+        return om.MFnDoubleArrayData().create(om.MDoubleArray(np.asarray(values, dtype=np.float64).tolist()))
+    return om.MFnIntArrayData().create(om.MIntArray(np.asarray(values, dtype=np.int64).tolist()))
+
+def createCsrSkin(mesh, skinFile=None, source=None):
+    '''Deform mesh with a gzCsrSkin node, a light skinning deformer without normalization.
+    Weights are read from a skinFile of any format, or copied from the skinCluster of the source mesh.
+    Influences are bound at their current position. Return the node name.
+    '''
+    if skinFile:
+        data = sst.readSkinFile(skinFile)
+    else:
+        sclst = getSkinCluster(source)[0]
+        if not sclst:
+            return MGlobal.displayError('"{}" is not skinned.'.format(source))
+        influences, weights = getSkinWeights(sclst)
+        data = sfu.SkinData.fromDense(str(source), influences, weights)
+    missing = [ inf for inf in data.influences if not cmds.objExists(inf) ]
+    if missing:
+        return MGlobal.displayError('{} not found in the scene.'.format(', '.join(missing)))
+
+    if not cmds.pluginInfo(os.path.basename(CSR_SKIN_PLUGIN), query=True, loaded=True):
+        cmds.loadPlugin(CSR_SKIN_PLUGIN, quiet=True)
+    cmds.undoInfo(openChunk=True, chunkName='createCsrSkin')
+    try:
+        node = cmds.deformer(mesh, type='gzCsrSkin', name='csrSkin_' + str(mesh).split('|')[-1])[0]
+
+        for i, inf in enumerate(data.influences):
+            cmds.connectAttr(inf + '.worldMatrix[0]', '{}.matrix[{}]'.format(node, i))
+            cmds.setAttr('{}.bindPreMatrix[{}]'.format(node, i), cmds.getAttr(inf + '.worldInverseMatrix[0]'),
+                         type='matrix')
+        if skinFile:
+            cmds.setAttr(node + '.weightFile', skinFile, type='string')
+        else:
+            # the CSR arrays are set through an undoable command, cmds.setAttr takes every value as an argument
+            msh.setPlugData([ (node + '.csrVertices', arrayData(data.vertices)),
+                              (node + '.csrOffsets', arrayData(data.offsets)),
+                              (node + '.csrIndices', arrayData(data.indices)),
+                              (node + '.csrWeights', arrayData(data.values, double=True)) ])
+    finally:
+        cmds.undoInfo(closeChunk=True)
+    return node
@@ -0,0 +1,290 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache(OrderedDict):
+    '''
+    Dict keeping at most maxSize items, the least recently used being dropped first. The caches below are keyed
+    by point content, so every edit of a mesh adds an entry and they would otherwise grow for the whole session.
+    '''
+
+    def __init__(self, maxSize=16):
+        super(LRUCache, self).__init__()
+        self.maxSize = maxSize
+
+    def __getitem__(self, key):
+        value = super(LRUCache, self).__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super(LRUCache, self).__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxSize:
+            self.popitem(last=False)
+
+
+def topologyHash(counts, connects):
+    '''Return the 16 bytes md5 digest of a mesh topology (polygon vertex counts and polygon vertex ids).'''
+    digest = hashlib.md5()
+    digest.update(np.ascontiguousarray(counts, dtype=np.int32).tobytes())
+    digest.update(np.ascontiguousarray(connects, dtype=np.int32).tobytes())
+    return digest.digest()
+
+def triangulate(counts, connects):
+    '''Fan triangulate polygons given as (polygon vertex counts, polygon vertex ids). Return a (T, 3) array.'''
+    counts = np.asarray(counts, dtype=np.int64)
+    connects = np.asarray(connects, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+
+    numTriangles = np.maximum(counts - 2, 0)
+    polygon = np.repeat(np.arange(len(counts)), numTriangles)
+    corner = np.arange(numTriangles.sum()) - np.repeat(np.cumsum(numTriangles) - numTriangles, numTriangles)
+    first = starts[polygon]
+
+    return np.stack([connects[first], connects[first + corner + 1], connects[first + corner + 2]], axis=1)
+
+def vertexAdjacency(counts, connects, numVertex=None):
+    '''Return the vertex adjacency of polygons (polygon vertex counts, polygon vertex ids) as CSR arrays
+    (offsets, neighbors): the neighbors of vertex i are neighbors[offsets[i]:offsets[i+1]], sorted.
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    connects = np.asarray(connects, dtype=np.int64)
+    if numVertex is None:
+        numVertex = int(connects.max()) + 1 if len(connects) else 0
+
+    # every polygon edge goes from a face vertex to the next one, the last one back to the first
+    ends = np.cumsum(counts)
+    following = np.arange(1, len(connects) + 1)
+    following[ends[counts > 0] - 1] = (ends - counts)[counts > 0]
+    a, b = connects, connects[following]
+    edges = np.unique(np.concatenate([a * numVertex + b, b * numVertex + a]))
+    edges = edges[edges // numVertex != edges % numVertex] if len(edges) else edges
+
+    offsets = np.zeros(numVertex + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges // numVertex, minlength=numVertex), out=offsets[1:])
+    return offsets, edges % numVertex
+
+ADJACENCY_CACHE = LRUCache(32)
+
+def getVertexAdjacency(counts, connects, numVertex=None):
+    '''Return vertexAdjacency, cached by topology hash.'''
+    key = (topologyHash(counts, connects), numVertex)
+    if key not in ADJACENCY_CACHE:
+        ADJACENCY_CACHE[key] = vertexAdjacency(counts, connects, numVertex)
+    return ADJACENCY_CACHE[key]
+
+def symmetryMap(points, axis=0, tolerance=1e-3):
+    '''Return for every point the id of the point mirrored across the plane normal to axis through the origin,
+    -1 when none is within tolerance. Points are hashed into cells twice the tolerance wide, so each mirrored
+    position is only compared with the points of the 8 cells its tolerance sphere touches.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    result = np.full(len(points), -1, dtype=np.int64)
+    if not len(points):
+        return result
+    mirrored = points.copy()
+    mirrored[:, axis] *= -1
+
+    cellSize = tolerance * 2.0
+    cells = np.floor(points / cellSize).astype(np.int64)
+    low = cells.min(axis=0) - 1
+    size = cells.max(axis=0) - low + 2
+    if np.prod(size.astype(np.float64)) >= 2 ** 62:
+        raise ValueError('Symmetry tolerance {} is too small for the mesh size.'.format(tolerance))
+
+    keys = ((cells[:, 0] - low[0]) * size[1] + cells[:, 1] - low[1]) * size[2] + cells[:, 2] - low[2]
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+
+    # the nearest cell border on every axis tells which neighbor cells the sphere reaches
+    queryCells = np.floor(mirrored / cellSize)
+    side = np.where(mirrored / cellSize - queryCells < 0.5, -1, 1)
+    queryCells = queryCells.astype(np.int64)
+
+    best = np.full(len(points), tolerance * tolerance)
+    for corner in np.stack(np.meshgrid([0, 1], [0, 1], [0, 1], indexing='ij'), -1).reshape(-1, 3):
+        cell = np.clip(queryCells + side * corner - low, 0, size - 1)
+        queryKeys = (cell[:, 0] * size[1] + cell[:, 1]) * size[2] + cell[:, 2]
+        start = np.searchsorted(sortedKeys, queryKeys, side='left')
+        end = np.searchsorted(sortedKeys, queryKeys, side='right')
+        # a cell only holds a few points, go through them one rank at a time for all queries
+        for rank in range(int((end - start).max())):
+            query = np.flatnonzero(start + rank < end)
+            candidate = order[start[query] + rank]
+            sqDist = ((points[candidate] - mirrored[query]) ** 2).sum(axis=1)
+            closer = sqDist <= best[query]
+            best[query[closer]] = sqDist[closer]
+            result[query[closer]] = candidate[closer]
+    return result
+
+SYMMETRY_CACHE = LRUCache(16)
+
+def getSymmetryMap(points, topoHash, axis=0, tolerance=1e-3):
+    '''Return symmetryMap, cached by topology hash, point positions, axis and tolerance.'''
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    key = (topoHash, hashlib.md5(points.tobytes()).digest(), axis, tolerance)
+    if key not in SYMMETRY_CACHE:
+        SYMMETRY_CACHE[key] = symmetryMap(points, axis, tolerance)
+    return SYMMETRY_CACHE[key]
+
+def closestPointOnTriangles(points, a, b, c):
+    '''
+    Closest point of every point on its triangle (a, b, c), all arrays of shape (N, 3).
+    Return (closest points, barycentric coordinates, squared distances).
+    '''
+    ab, ac = b - a, c - a
+    ap, bp, cp = points - a, points - b, points - c
+    d1, d2 = np.einsum('ij,ij->i', ab, ap), np.einsum('ij,ij->i', ac, ap)
+    d3, d4 = np.einsum('ij,ij->i', ab, bp), np.einsum('ij,ij->i', ac, bp)
+    d5, d6 = np.einsum('ij,ij->i', ab, cp), np.einsum('ij,ij->i', ac, cp)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+    def ratio(num, den):
+        return np.divide(num, den, out=np.zeros_like(num), where=den != 0)
+
+    # inside the face, then every voronoi region overriding it, the vertices having the last word
+    total = va + vb + vc
+    v, w = ratio(vb, total), ratio(vc, total)
+    bary = np.stack([1.0 - v - w, v, w], axis=1)
+
+    e = ratio(d4 - d3, (d4 - d3) + (d5 - d6))
+    mask = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+    bary[mask] = np.stack([np.zeros_like(e), 1.0 - e, e], axis=1)[mask]
+    e = ratio(d2, d2 - d6)
+    mask = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+    bary[mask] = np.stack([1.0 - e, np.zeros_like(e), e], axis=1)[mask]
+    bary[(d6 >= 0) & (d5 <= d6)] = (0.0, 0.0, 1.0)
+    e = ratio(d1, d1 - d3)
+    mask = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+    bary[mask] = np.stack([1.0 - e, e, np.zeros_like(e)], axis=1)[mask]
+    bary[(d3 >= 0) & (d4 <= d3)] = (0.0, 1.0, 0.0)
+    bary[(d1 <= 0) & (d2 <= 0)] = (1.0, 0.0, 0.0)
+
+    closest = bary[:, 0:1] * a + bary[:, 1:2] * b + bary[:, 2:3] * c
+    distance = np.einsum('ij,ij->i', points - closest, points - closest)
+
+    return closest, bary, distance
+
+
+class TriangleIndex(object):
+    '''
+    Bounding volume tree (a kd split of the triangle centroids) for exact closest point queries, pure numpy.
+    All the queries walk the tree together, level by level: a first greedy descent gives every point an upper
+    bound, then any node farther than the current best distance of a point is pruned for that point.
+    '''
+
+    def __init__(self, points, triangles, leafSize=8):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+
+        corners = self.points[self.triangles]
+        triLower, triUpper = corners.min(axis=1), corners.max(axis=1)
+        centroids = corners.mean(axis=1)
+
+        # split the longest axis of the centroids at the median until leaves are small enough
+        self.order = np.arange(len(self.triangles))
+        ranges, left, right = [(0, len(self.triangles))], [], []
+        i = 0
+        while i < len(ranges):
+            start, end = ranges[i]
+            if end - start <= leafSize:
+                left.append(-1)
+                right.append(-1)
+            else:
+                ids = self.order[start:end]
+                axis = np.argmax(np.ptp(centroids[ids], axis=0))
+                mid = (end - start) // 2
+                self.order[start:end] = ids[np.argpartition(centroids[ids, axis], mid)]
+                left.append(len(ranges))
+                ranges.append((start, start + mid))
+                right.append(len(ranges))
+                ranges.append((start + mid, end))
+            i += 1
+
+        ranges = np.array(ranges, dtype=np.int64).reshape(-1, 2)
+        self.left, self.right = np.array(left, dtype=np.int64), np.array(right, dtype=np.int64)
+        self.start, self.count = ranges[:, 0], ranges[:, 1] - ranges[:, 0]
+
+        # node bounds, every node range reduced at once
+        lower = np.concatenate([triLower[self.order], np.zeros((1, 3))])
+        upper = np.concatenate([triUpper[self.order], np.zeros((1, 3))])
+        self.lower = np.minimum.reduceat(lower, ranges.ravel())[::2]
+        self.upper = np.maximum.reduceat(upper, ranges.ravel())[::2]
+
+    @staticmethod
+    def boxDistance(points, lower, upper):
+        delta = np.maximum(lower - points, 0.0) + np.maximum(points - upper, 0.0)
+        return np.einsum('ij,ij->i', delta, delta)
+
+    def testLeaves(self, points, query, nodes, best):
+        '''Update best (triangle ids, barycentric coordinates, squared distances) with the leaf triangles.'''
+        counts = self.count[nodes]
+        pairQuery = np.repeat(query, counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        triangle = self.order[np.repeat(self.start[nodes], counts) + local]
+
+        corners = self.points[self.triangles[triangle]]
+        closest, bary, distance = closestPointOnTriangles(points[pairQuery], corners[:, 0], corners[:, 1],
+                                                          corners[:, 2])
+
+        # keep the nearest triangle of every query, ties resolve to any of them
+        np.minimum.at(best[2], pairQuery, distance)
+        win = distance == best[2][pairQuery]
+        ids = pairQuery[win]
+        best[0][ids], best[1][ids] = triangle[win], bary[win]
+
+    def closest(self, points):
+        '''Return (triangle ids, barycentric coordinates, squared distances) of the closest surface points.'''
+        points = np.asarray(points, dtype=np.float64)
+        best = (np.zeros(len(points), dtype=np.int64), np.zeros((len(points), 3)), np.full(len(points), np.inf))
+        if not len(self.triangles):
+            return best
+
+        # greedy descent to the nearest looking leaf, for an upper bound
+        nodes = np.zeros(len(points), dtype=np.int64)
+        inner = np.flatnonzero(self.left[nodes] >= 0)
+        while len(inner):
+            left, right = self.left[nodes[inner]], self.right[nodes[inner]]
+            nearLeft = self.boxDistance(points[inner], self.lower[left], self.upper[left]) <= \
+                       self.boxDistance(points[inner], self.lower[right], self.upper[right])
+            nodes[inner] = np.where(nearLeft, left, right)
+            inner = inner[self.left[nodes[inner]] >= 0]
+        self.testLeaves(points, np.arange(len(points)), nodes, best)
+
+        # exact walk, pruning the nodes farther than the best distance found so far
+        query, nodes = np.arange(len(points)), np.zeros(len(points), dtype=np.int64)
+        while len(query):
+            near = self.boxDistance(points[query], self.lower[nodes], self.upper[nodes]) < best[2][query]
+            query, nodes = query[near], nodes[near]
+            leaf = self.left[nodes] < 0
+            if leaf.any():
+                self.testLeaves(points, query[leaf], nodes[leaf], best)
+            inner = nodes[~leaf]
+            query, nodes = np.tile(query[~leaf], 2), np.concatenate([self.left[inner], self.right[inner]])
+
+        return best
+
+    def interpolate(self, values, triangleIds, bary):
+        '''Blend per vertex values (V, ...) of the triangle corners with barycentric coordinates.'''
+        corners = self.triangles[triangleIds]
+        values = np.asarray(values)
+        shape = (-1,) + (1,) * (values.ndim - 1)
+        return sum([ bary[:, k].reshape(shape) * values[corners[:, k]] for k in range(3) ])
+
+
+TRIANGLE_INDEX_CACHE = LRUCache(8)
+
+def getTriangleIndex(points, triangles):
+    '''Return a TriangleIndex, cached by the content of points and triangles.'''
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    triangles = np.ascontiguousarray(triangles, dtype=np.int64)
+    digest = hashlib.md5(points.tobytes())
+    digest.update(triangles.tobytes())
+    key = digest.hexdigest()
+
+    if key not in TRIANGLE_INDEX_CACHE:
+        TRIANGLE_INDEX_CACHE[key] = TriangleIndex(points, triangles)
+    return TRIANGLE_INDEX_CACHE[key]
@@ -0,0 +1,169 @@
+import mmap
+import struct
+
+import numpy as np
+
+TARGET_LIB_EXT = '.btl'
+
+# binary ".btl" blendShape target library, little endian:
+#   header  : magic, version, flags, mesh vertex count, target count, value count, rank, topology hash,
+#             mesh name size, target table size
+#   strings : mesh name, target names joined by new lines (utf-8)
+#   sparse  : counts (uint32, targets), vertex ids (uint32, values), deltas (float32 or float16, values x 3)
+#   pca     : vertex ids (uint32, values) moved by any target, coefficients (float32, targets x rank),
+#             basis (float32 or float16, rank x values x 3). Every block starts on 8 bytes.
+# Targets are sparse deltas [(name, vertex ids, offsets (moved, 3))], any subset is read through a memory map.
+LIB_MAGIC = b'GZTL'
+LIB_VERSION = 1
+LIB_HEADER = struct.Struct('<4sHHIIQI16sII')
+FLAG_HALF = 1
+FLAG_PCA = 2
+
+def _align(size):
+    return (size + 7) & ~7
+
+def _libraryLayout(header):
+    '''Return the byte position of every array block described by an unpacked header.'''
+    magic, version, flags, numVertex, numTargets, numValues, rank, topoHash, nameSize, targetSize = header
+    deltaType = np.float16 if flags & FLAG_HALF else np.float32
+    if flags & FLAG_PCA:
+        blocks = (('vertices', np.uint32, (numValues,)),
+                  ('coefficients', np.float32, (numTargets, rank)),
+                  ('basis', deltaType, (rank, numValues, 3)))
+    else:
+        blocks = (('counts', np.uint32, (numTargets,)),
+                  ('vertices', np.uint32, (numValues,)),
+                  ('deltas', deltaType, (numValues, 3)))
+
+    position = _align(LIB_HEADER.size + nameSize + targetSize)
+    layout = dict()
+    for key, dtype, shape in blocks:
+        layout[key] = (position, np.dtype(dtype), shape)
+        position = _align(position + np.dtype(dtype).itemsize * int(np.prod(shape)))
+    return layout
+
+def _libraryArray(buffer, layout, key):
+    position, dtype, shape = layout[key]
+    return np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=position).reshape(shape)
+
+def denseDeltas(deltas, numVertex, vertices=None):
+    '''Return sparse target deltas as a (targets, vertices, 3) array, over the given vertex ids only if any.'''
+    dense = np.zeros((len(deltas), numVertex if vertices is None else len(vertices), 3), dtype=np.float64)
+    for x, (name, ids, offsets) in enumerate(deltas):
+        if vertices is not None:
+            ids = np.searchsorted(vertices, ids)
+        dense[x, ids] = offsets
+    return dense
+
+def principalDeltas(dense, energy=0.9999, maxRank=0):
+    '''Factor dense deltas (targets, values, 3) as coefficients (targets, rank) x basis (rank, values, 3), keeping the
+    smallest rank holding energy of the squared deltas (capped by maxRank if given). Targets are not centered, so a
+    zero target stays exactly zero.
+    '''
+    matrix = dense.reshape(len(dense), -1)
+    u, s, vt = np.linalg.svd(matrix, full_matrices=False)
+    kept = np.cumsum(s ** 2) / max((s ** 2).sum(), 1e-30)
+    rank = min(int(np.searchsorted(kept, energy)) + 1, len(s))
+    if maxRank:
+        rank = min(rank, maxRank)
+    return u[:, :rank] * s[:rank], vt[:rank].reshape(rank, dense.shape[1], 3)
+
+def writeTargetLibrary(filePath, meshName, deltas, numVertex, topologyHash=b'', half=False, pca=False,
+                       energy=0.9999, maxRank=0):
+    '''Write sparse target deltas [(name, vertex ids, offsets)] to a ".btl" library. Return filePath.
+    half stores the deltas (or the pca basis) as float16, pca factors correlated targets into a low rank basis
+    over the vertices moved by any target.
+    '''
+    names = [ str(name) for name, ids, offsets in deltas ]
+    if any('\n' in name for name in names):
+        raise ValueError('Target names cannot hold new lines.')
+    flags = (FLAG_HALF if half else 0) | (FLAG_PCA if pca else 0)
+
+    if pca:
+        vertices = np.unique(np.concatenate([ np.asarray(ids, dtype=np.int64) for n, ids, o in deltas ] +
+                                            [ np.zeros(0, dtype=np.int64) ]))
+        coefficients, basis = principalDeltas(denseDeltas(deltas, numVertex, vertices), energy, maxRank) \
+            if len(vertices) else (np.zeros((len(deltas), 0)), np.zeros((0, 0, 3)))
+        arrays = dict(vertices=vertices, coefficients=coefficients, basis=basis)
+        numValues, rank = len(vertices), coefficients.shape[1]
+    else:
+        counts = np.array([ len(ids) for n, ids, o in deltas ], dtype=np.uint32)
+        arrays = dict(counts=counts,
+                      vertices=np.concatenate([ np.asarray(ids) for n, ids, o in deltas ] + [ np.zeros(0) ]),
+                      deltas=np.concatenate([ np.asarray(o).reshape(-1, 3) for n, ids, o in deltas ] +
+                                            [ np.zeros((0, 3)) ]))
+        numValues, rank = int(counts.sum()), 0
+
+    name = meshName.encode('utf-8')
+    table = '\n'.join(names).encode('utf-8')
+    header = (LIB_MAGIC, LIB_VERSION, flags, numVertex, len(names), numValues, rank,
+              topologyHash.ljust(16, b'\0'), len(name), len(table))
+
+    layout = _libraryLayout(header)
+    with open(filePath, 'wb') as fileObj:
+        fileObj.write(LIB_HEADER.pack(*header) + name + table)
+        for key in sorted(layout, key=lambda k: layout[k][0]):
+            position, dtype, shape = layout[key]
+            fileObj.write(b'\0' * (position - fileObj.tell()))
+            fileObj.write(np.ascontiguousarray(arrays[key], dtype=dtype).tobytes())
+    return filePath
+
+def readLibraryHeader(buffer):
+    '''Return (meshName, target names, numVertex, topologyHash, flags, layout) from the start of a ".btl" buffer.'''
+    header = LIB_HEADER.unpack_from(buffer, 0)
+    if header[0] != LIB_MAGIC:
+        raise ValueError('Not a blendShape target library.')
+    if header[1] > LIB_VERSION:
+        raise ValueError('Target library version {} is not supported.'.format(header[1]))
+
+    nameSize, targetSize = header[-2:]
+    strings = bytes(buffer[LIB_HEADER.size:LIB_HEADER.size + nameSize + targetSize])
+    names = strings[nameSize:].decode('utf-8').split('\n') if header[4] else []
+    topoHash = header[7] if header[7].strip(b'\0') else b''
+
+    return strings[:nameSize].decode('utf-8'), names, header[3], topoHash, header[2], _libraryLayout(header)
+
+def readLibraryInfo(filePath):
+    '''Return (meshName, target names, numVertex, topologyHash) of a ".btl" file, without reading its deltas.'''
+    with open(filePath, 'rb') as fileObj:
+        buffer = fileObj.read(LIB_HEADER.size)
+        buffer += fileObj.read(sum(LIB_HEADER.unpack_from(buffer, 0)[-2:]) if len(buffer) == LIB_HEADER.size else 0)
+    return readLibraryHeader(buffer)[:4]
+
+def _readTargets(buffer, targets, tolerance):
+    meshName, names, numVertex, topoHash, flags, layout = readLibraryHeader(buffer)
+    index = dict([ (name, x) for x, name in enumerate(names) ])
+    if targets is None:
+        targets = names
+    missing = [ t for t in targets if t not in index ]
+    if missing:
+        raise ValueError('{} not in the target library.'.format(', '.join(missing)))
+    rows = np.array([ index[t] for t in targets ], dtype=np.int64)
+
+    if flags & FLAG_PCA:
+        vertices = _libraryArray(buffer, layout, 'vertices').astype(np.int64)
+        basis = _libraryArray(buffer, layout, 'basis')
+        coefficients = _libraryArray(buffer, layout, 'coefficients')[rows]
+        basis = basis.reshape(len(basis), len(vertices) * 3).astype(np.float32)
+        dense = np.dot(coefficients, basis).reshape(len(rows), len(vertices), 3)
+        moved = (dense.astype(np.float64) ** 2).sum(axis=2) > tolerance * tolerance
+        return [ (t, vertices[m], dense[x, m].astype(np.float64)) for x, (t, m) in enumerate(zip(targets, moved)) ]
+
+    counts = _libraryArray(buffer, layout, 'counts').astype(np.int64)
+    starts = np.cumsum(counts) - counts
+    fileVertices = _libraryArray(buffer, layout, 'vertices')
+    fileDeltas = _libraryArray(buffer, layout, 'deltas')
+    return [ (t, fileVertices[starts[r]:starts[r] + counts[r]].astype(np.int64),
+              fileDeltas[starts[r]:starts[r] + counts[r]].astype(np.float64)) for t, r in zip(targets, rows) ]
+
+def readTargetLibrary(filePath, targets=None, tolerance=1e-5):
+    '''Read sparse target deltas [(name, vertex ids, offsets)] of the given target names (every target when None)
+    through a memory map, only their blocks are read. pca targets are rebuilt in one product and vertices moved
+    less than tolerance are dropped.
+    '''
+    with open(filePath, 'rb') as fileObj:
+        buffer = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _readTargets(buffer, targets, tolerance)
+    finally:
+        buffer.close()
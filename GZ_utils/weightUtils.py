@@ -0,0 +1,143 @@
+import numpy as np
+
+def normalizeWeights(weights, locked=None):
+    '''Return weights (vertex x influence) scaled so every row sums to 1. Empty rows stay empty.
+    locked is a bool mask of the influence columns kept as they are, the other columns share what is left.
+    '''
+    weights = np.asarray(weights, dtype=np.float64)
+    if locked is None or not np.any(locked):
+        total = weights.sum(axis=1, keepdims=True)
+        return np.divide(weights, total, out=np.zeros_like(weights), where=total > 0)
+
+    locked = np.asarray(locked, dtype=bool)
+    free = weights * ~locked
+    total = free.sum(axis=1, keepdims=True)
+    left = np.clip(1.0 - (weights * locked).sum(axis=1, keepdims=True), 0.0, None)
+    scale = np.divide(left, total, out=np.ones_like(total), where=total > 0)
+    return np.where(locked, weights, free * scale)
+
+def pruneWeights(weights, threshold, locked=None):
+    '''Return weights with the values below threshold set to zero, locked influence columns are kept.'''
+    weights = np.asarray(weights, dtype=np.float64)
+    prune = weights < threshold
+    if locked is not None:
+        prune &= ~np.asarray(locked, dtype=bool)
+    return np.where(prune, 0.0, weights)
+
+def limitInfluences(weights, maxInfluences, locked=None):
+    '''Return weights keeping only the maxInfluences biggest values of every row.
+    Non zero weights of locked influence columns rank first and are always kept.
+    '''
+    weights = np.asarray(weights, dtype=np.float64)
+    if maxInfluences <= 0 or maxInfluences >= weights.shape[1]:
+        return weights.copy()
+
+    score = weights.copy()
+    if locked is not None:
+        lockedUsed = (weights > 0) & np.asarray(locked, dtype=bool)
+        score[lockedUsed] = np.inf
+    drop = np.argpartition(-score, maxInfluences - 1, axis=1)[:, maxInfluences:]
+    keep = np.ones(weights.shape, dtype=bool)
+    np.put_along_axis(keep, drop, False, axis=1)
+    if locked is not None:
+        keep |= lockedUsed
+    return np.where(keep, weights, 0.0)
+
+def cleanWeights(weights, threshold=0.0, maxInfluences=0, locked=None, tolerance=1e-7):
+    '''Prune weights below threshold, keep at most maxInfluences per vertex and normalize, respecting locked
+    influence columns.
+
+    Return (weights, report), report being a dict of the changed vertex rows ('vertices'), the count of weights
+    pruned ('pruned') and dropped by the influence limit ('limited'), and the biggest weight change ('maxChange').
+    '''
+    weights = np.asarray(weights, dtype=np.float64)
+    pruned = pruneWeights(weights, threshold, locked) if threshold > 0 else weights
+    limited = limitInfluences(pruned, maxInfluences, locked)
+    result = normalizeWeights(limited, locked)
+
+    change = np.abs(result - weights).max(axis=1) if weights.size else np.zeros(len(weights))
+    report = dict(vertices=np.flatnonzero(change > tolerance),
+                  pruned=int(np.count_nonzero(weights) - np.count_nonzero(pruned)),
+                  limited=int(np.count_nonzero(pruned) - np.count_nonzero(limited)),
+                  maxChange=float(change.max()) if len(change) else 0.0)
+    return result, report
+
+def remapInfluences(weights, influences, targetInfluences):
+    '''Return weights with their columns moved from influences order to targetInfluences order, by name.
+    Columns of targetInfluences missing from influences are zero, influences missing from targetInfluences
+    are dropped.
+    '''
+    weights = np.asarray(weights)
+    result = np.zeros((len(weights), len(targetInfluences)), dtype=weights.dtype)
+    column = dict([ (inf, x) for x, inf in enumerate(targetInfluences) ])
+    pairs = [ (x, column[inf]) for x, inf in enumerate(influences) if inf in column ]
+    if pairs:
+        source, target = zip(*pairs)
+        result[:, list(target)] = weights[:, list(source)]
+    return result
+
+def averageNeighbors(values, adjacency):
+    '''Return the mean of the rows of values over the neighbors of every vertex, adjacency being CSR
+    (offsets, neighbors). Vertices without neighbors keep their own row.
+    '''
+    offsets, neighbors = adjacency
+    counts = np.diff(offsets)
+    gathered = np.concatenate([values[neighbors], np.zeros((1,) + values.shape[1:], dtype=values.dtype)])
+    sums = np.add.reduceat(gathered, np.minimum(offsets[:-1], len(neighbors)), axis=0)
+    alone = counts == 0
+    sums[alone] = values[alone]
+    return sums / np.maximum(counts, 1).reshape((-1,) + (1,) * (values.ndim - 1))
+
+def smoothWeights(weights, adjacency, iterations=1, strength=0.5, mask=None, taubin=False, inflate=-0.53,
+                  locked=None):
+    '''Return weights (vertex x influence) smoothed with iterations of Laplacian smoothing over adjacency
+    (see spatialUtils.vertexAdjacency), then normalized.
+
+    taubin alternates every step with an inflate step, keeping weight gradients from spreading.
+    mask is a bool array or vertex ids of the vertices to smooth, other vertices only act as neighbors.
+    locked is a bool mask of the influence columns left untouched.
+    '''
+    weights = np.asarray(weights, dtype=np.float64)
+    result = weights.copy()
+    rows = np.arange(len(weights)) if mask is None else np.asarray(mask)
+    if rows.dtype == bool:
+        rows = np.flatnonzero(rows)
+    columns = np.arange(weights.shape[1]) if locked is None else np.flatnonzero(~np.asarray(locked, dtype=bool))
+
+    factors = [strength, inflate] if taubin else [strength]
+    for i in range(iterations):
+        for factor in factors:
+            values = result[:, columns]
+            average = averageNeighbors(values, adjacency)
+            result[np.ix_(rows, columns)] = values[rows] + factor * (average[rows] - values[rows])
+
+    result[rows] = normalizeWeights(np.clip(result[rows], 0.0, None), locked)
+    return result
+
+def mirrorInfluenceName(name, sides=('lt_', 'rt_')):
+    '''Return the name of the other side of an influence, or the name itself. Only a side token starting the
+    name, or starting its last part after a namespace ":" or a path "|", is swapped: "ns:lt_arm" gives "ns:rt_arm",
+    "belt_jnt" is kept.
+    '''
+    start = max(name.rfind(':'), name.rfind('|')) + 1
+    for side, other in (sides, sides[::-1]):
+        if name.startswith(side, start):
+            return name[:start] + other + name[start + len(side):]
+    return name
+
+def mirrorWeights(weights, influences, mirrorMap, vertices=None, sides=('lt_', 'rt_')):
+    '''Return weights (vertex x influence) where the rows of vertices are copied from their mirrored vertex
+    (see spatialUtils.symmetryMap), lt_ and rt_ influence columns swapped. By default every mirrored vertex.
+    '''
+    weights = np.asarray(weights, dtype=np.float64)
+    column = dict([ (inf, x) for x, inf in enumerate(influences) ])
+    columns = np.array([ column.get(mirrorInfluenceName(inf, sides), x) for x, inf in enumerate(influences) ],
+                       dtype=np.int64)
+
+    mirrorMap = np.asarray(mirrorMap, dtype=np.int64)
+    rows = np.arange(len(weights)) if vertices is None else np.asarray(vertices, dtype=np.int64)
+    rows = rows[mirrorMap[rows] >= 0]
+
+    result = weights.copy()
+    result[np.ix_(rows, columns)] = weights[mirrorMap[rows]]
+    return result
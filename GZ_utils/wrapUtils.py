@@ -0,0 +1,134 @@
+import os
+import hashlib
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from GZ_utils import spatialUtils as spu
+
+# A target vertex is bound to its closest source triangle: the barycentric coordinates of the closest point and
+# the offset from that point in the triangle frame (first edge, normal x first edge, normal), so the offset turns
+# with the triangle like a wrap deformer with a zero max distance.
+EPSILON = 1e-12
+
+# bindings are cached on disk as "<key>.wrapb" files, key being the sha1 of both meshes topology and rest points,
+# so the closest triangle search runs once per pair of assets. Points are rounded to KEY_DECIMALS before hashing.
+BINDING_EXT = '.wrapb'
+BINDING_VERSION = 1
+KEY_DECIMALS = 5
+BINDING_CACHE = spu.LRUCache(32)
+
+
+class WrapBinding(namedtuple('WrapBinding', 'triangles triangleIds bary offsets')):
+    '''
+    triangles (T, 3) are the source triangles, triangleIds, bary (V, 3) and offsets (V, 3) describe every target
+    vertex on them.
+    '''
+    __slots__ = ()
+
+
+def _cross(a, b):
+    '''np.cross for (..., 3) arrays, without its generic axis handling.'''
+    ax, ay, az = a[..., 0], a[..., 1], a[..., 2]
+    bx, by, bz = b[..., 0], b[..., 1], b[..., 2]
+    return np.stack([ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx], axis=-1)
+
+def _normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), EPSILON)
+
+def triangleFrames(points, triangles):
+    '''Return the orthonormal frames (..., T, 3, 3) of triangles on points (..., S, 3), rows being the frame axes.'''
+    a, b, c = [ points[..., triangles[:, k], :] for k in range(3) ]
+    tangent = _normalize(b - a)
+    normal = _normalize(_cross(b - a, c - a))
+    return np.stack([tangent, _cross(normal, tangent), normal], axis=-2)
+
+def bindWrap(sourcePoints, triangles, targetPoints):
+    '''Bind targetPoints (V, 3) to the closest triangles (T, 3) of sourcePoints (S, 3). Return a WrapBinding.'''
+    sourcePoints = np.asarray(sourcePoints, dtype=np.float64)
+    targetPoints = np.asarray(targetPoints, dtype=np.float64)
+    triangles = np.asarray(triangles, dtype=np.int64)
+    index = spu.getTriangleIndex(sourcePoints, triangles)
+    triangleIds, bary, sqDist = index.closest(targetPoints)
+
+    closest = index.interpolate(sourcePoints, triangleIds, bary)
+    frames = triangleFrames(sourcePoints, triangles[triangleIds])
+    offsets = np.einsum('vij,vj->vi', frames, targetPoints - closest)
+    return WrapBinding(triangles, triangleIds, bary, offsets)
+
+def evaluateWrap(binding, sourcePoints):
+    '''Return the target points (..., V, 3) following deformed sourcePoints (..., S, 3), many shapes at once.'''
+    sourcePoints = np.asarray(sourcePoints, dtype=np.float64)
+    corners = binding.triangles[binding.triangleIds]
+    a, b, c = [ sourcePoints[..., corners[:, k], :] for k in range(3) ]
+
+    tangent = _normalize(b - a)
+    normal = _normalize(_cross(b - a, c - a))
+    bitangent = _cross(normal, tangent)
+    offsets = binding.offsets
+    return binding.bary[:, 0, None] * a + binding.bary[:, 1, None] * b + binding.bary[:, 2, None] * c + \
+           offsets[:, 0, None] * tangent + offsets[:, 1, None] * bitangent + offsets[:, 2, None] * normal
+
+def wrapDeltas(binding, restPoints, deltas):
+    '''Return the target deltas (..., V, 3) for source deltas (..., S, 3) applied on source restPoints (S, 3).'''
+    rest = evaluateWrap(binding, restPoints)
+    return evaluateWrap(binding, restPoints + np.asarray(deltas, dtype=np.float64)) - rest
+
+def bindingKey(sourcePoints, triangles, targetPoints, targetTopology=b''):
+    '''Return the hex digest identifying a binding: source triangles and rest points, target topology and rest points.'''
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(triangles, dtype=np.int32).tobytes())
+    for points in (sourcePoints, targetPoints):
+        points = np.round(np.asarray(points, dtype=np.float64), KEY_DECIMALS) + 0.0
+        digest.update(np.int64(len(points)).tobytes())
+        digest.update(np.ascontiguousarray(points).tobytes())
+    digest.update(targetTopology)
+    return digest.hexdigest()
+
+def saveBinding(filePath, binding, key=''):
+    '''Write a binding as compact int32/float32 arrays, next to filePath then moved in place.'''
+    tmpPath = '{}.{}.{}.tmp'.format(filePath, os.getpid(), threading.current_thread().ident)
+    with open(tmpPath, 'wb') as fileObj:
+        np.savez(fileObj, version=np.int32(BINDING_VERSION), key=np.array(key),
+                 triangles=np.asarray(binding.triangles, dtype=np.int32),
+                 triangleIds=np.asarray(binding.triangleIds, dtype=np.int32),
+                 bary=np.asarray(binding.bary, dtype=np.float32),
+                 offsets=np.asarray(binding.offsets, dtype=np.float32))
+    os.replace(tmpPath, filePath)
+    return filePath
+
+def loadBinding(filePath, key=None):
+    '''Read a binding file. Return None when key is given and the file was saved for another key.'''
+    with np.load(filePath) as data:
+        if 'version' in data and int(data['version']) > BINDING_VERSION:
+            raise ValueError('"{}" binding version {} is not supported.'.format(filePath, int(data['version'])))
+        if key is not None and ('key' not in data or str(data['key']) != key):
+            return None
+        return WrapBinding(data['triangles'].astype(np.int64), data['triangleIds'].astype(np.int64),
+                           data['bary'].astype(np.float64), data['offsets'].astype(np.float64))
+
+def getCachedBinding(cacheDir, sourcePoints, triangles, targetPoints, targetTopology=b''):
+    '''Return the binding of targetPoints to the source triangles, from memory, from cacheDir or bound and saved.
+    Return (binding, key).
+    '''
+    key = bindingKey(sourcePoints, triangles, targetPoints, targetTopology)
+    if key in BINDING_CACHE:
+        return BINDING_CACHE[key], key
+
+    filePath = os.path.join(cacheDir, key + BINDING_EXT) if cacheDir else None
+    binding = None
+    if filePath and os.path.exists(filePath):
+        try:
+            binding = loadBinding(filePath, key)
+        except (IOError, OSError, ValueError, KeyError):
+            binding = None
+    if binding is None:
+        binding = bindWrap(sourcePoints, triangles, targetPoints)
+        if filePath:
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir, exist_ok=True)
+            saveBinding(filePath, binding, key)
+
+    BINDING_CACHE[key] = binding
+    return binding, key
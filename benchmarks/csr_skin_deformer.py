@@ -0,0 +1,78 @@
+'''
+Evaluation time of the gzCsrSkin deformer against a skinCluster with the same weights, on a skinned grid.
+Run with mayapy: mayapy benchmarks/csr_skin_deformer.py [--sizes 100 300] [--influences 40] [--frames 50]
+'''
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def createSkinnedGrid(size, numInfluence, maxInfluence=4, seed=0):
+    '''Return (mesh, joints) of a size x size grid skinned to a joint chain with random weights.'''
+    from maya import cmds
+    from GZ_utils import skinUtils as skn
+    from GZ_utils import weightUtils as wtu
+
+    mesh = cmds.polyPlane(width=10, height=10, subdivisionsX=size, subdivisionsY=size, name='grid_{}'.format(size))[0]
+    cmds.select(clear=True)
+    joints = [ cmds.joint(position=(0, 0, -5 + 10.0 * i / numInfluence)) for i in range(numInfluence) ]
+    sclst = cmds.skinCluster(joints, mesh, toSelectedBones=True, maximumInfluences=maxInfluence)[0]
+
+    random = np.random.RandomState(seed)
+    numVertex = cmds.polyEvaluate(mesh, vertex=True)
+    weights = np.zeros((numVertex, numInfluence))
+    columns = np.argsort(random.rand(numVertex, numInfluence), axis=1)[:, :maxInfluence]
+    np.put_along_axis(weights, columns, random.rand(numVertex, maxInfluence), axis=1)
+    skn.setSkinWeights(sclst, wtu.normalizeWeights(weights), joints)
+    return mesh, joints
+
+def pullPoints(mesh):
+    from GZ_utils import meshUtils as msh
+    return msh.getPoints(mesh)
+
+def run(sizes, numInfluence, frames):
+    from maya import cmds
+    from GZ_utils import skinUtils as skn
+
+    print('{:>10} {:>16} {:>16} {:>12}'.format('vertices', 'skinCluster ms', 'gzCsrSkin ms', 'max diff'))
+    for size in sizes:
+        cmds.file(new=True, force=True)
+        mesh, joints = createSkinnedGrid(size, numInfluence)
+        proxy = cmds.polyPlane(width=10, height=10, subdivisionsX=size, subdivisionsY=size, name='proxy')[0]
+        skn.createCsrSkin(proxy, source=mesh)
+
+        skinTime, csrTime, maxDiff = 0.0, 0.0, 0.0
+        for frame in range(frames):
+            for i, joint in enumerate(joints):
+                cmds.setAttr(joint + '.rotateY', np.sin(frame * 0.3 + i) * 30.0)
+            start = time.time()
+            skinned = pullPoints(mesh)
+            skinTime += time.time() - start
+            start = time.time()
+            deformed = pullPoints(proxy)
+            csrTime += time.time() - start
+            maxDiff = max(maxDiff, float(np.abs(skinned - deformed).max()))
+
+        numVertex = (size + 1) ** 2
+        print('{:>10} {:>16.2f} {:>16.2f} {:>12.2e}'.format(numVertex, skinTime * 1000.0 / frames,
+                                                            csrTime * 1000.0 / frames, maxDiff))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 300, 600], help='grid subdivisions')
+    parser.add_argument('--influences', type=int, default=40)
+    parser.add_argument('--frames', type=int, default=50)
+    args = parser.parse_args()
+
+    import maya.standalone
+    maya.standalone.initialize()
+    try:
+        run(args.sizes, args.influences, args.frames)
+    finally:
+        maya.standalone.uninitialize()
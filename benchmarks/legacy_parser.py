@@ -0,0 +1,70 @@
+'''
+Throughput of the ".sw" text parser against the eval() reader it replaced, on synthetic skin files.
+Run with any python that has numpy: python benchmarks/legacy_parser.py [--sizes 10000 100000 1000000]
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from GZ_utils import skinFileUtils as sfu
+
+
+def readLegacySkinEval(filePath):
+    '''The former loadSkin reader: eval() of the header and of every vertex line.'''
+    with open(filePath, 'r') as fileObj:
+        influences = eval(fileObj.readline())
+        column = dict([ (inf, x) for x, inf in enumerate(influences) ])
+        vertices, rows = [], []
+        for line in fileObj:
+            vtxName, values = line.rstrip('\n').split(',', 1)
+            vertices.append(int(vtxName[vtxName.rindex('[') + 1:-1]))
+            row = [0.0] * len(influences)
+            for inf, weight in eval(values):
+                row[column[inf]] = weight
+            rows.append(row)
+    return influences, vertices, rows
+
+def createSyntheticSkin(filePath, numVertex, numInfluence=8, maxInfluence=4, seed=0):
+    '''Write a ".sw" file with random normalized weights, maxInfluence non zero weights per vertex.'''
+    random = np.random.RandomState(seed)
+    weights = np.zeros((numVertex, numInfluence))
+    columns = np.argsort(random.rand(numVertex, numInfluence), axis=1)[:, :maxInfluence]
+    np.put_along_axis(weights, columns, random.rand(numVertex, maxInfluence), axis=1)
+    weights /= weights.sum(axis=1, keepdims=True)
+    influences = [ 'joint_{:02d}_JNT'.format(i) for i in range(numInfluence) ]
+    sfu.writeLegacySkin(filePath, 'geo_body', influences, weights)
+
+def timeIt(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+def run(sizes, numInfluence, directory, skipEval):
+    print('{:>10} {:>10} {:>16} {:>16} {:>8}'.format('vertices', 'MB', 'eval vtx/s', 'parser vtx/s', 'speedup'))
+    for size in sizes:
+        filePath = os.path.join(directory, 'synthetic_{}.sw'.format(size))
+        createSyntheticSkin(filePath, size, numInfluence)
+        megabytes = os.path.getsize(filePath) / float(1 << 20)
+
+        parserTime = timeIt(sfu.readLegacySkin, filePath)
+        evalTime = None if size > skipEval else timeIt(readLegacySkinEval, filePath)
+        os.remove(filePath)
+
+        evalRate = '-' if evalTime is None else '{:,.0f}'.format(size / evalTime)
+        speedup = '-' if evalTime is None else '{:.1f}x'.format(evalTime / parserTime)
+        print('{:>10} {:>10.1f} {:>16} {:>16,.0f} {:>8}'.format(size, megabytes, evalRate, size / parserTime, speedup))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--influences', type=int, default=8, help='influences per file, all written per line')
+    parser.add_argument('--skip-eval', type=int, default=sys.maxsize, help='no eval run above this vertex count')
+    parser.add_argument('--directory', default=tempfile.gettempdir())
+    args = parser.parse_args()
+    run(args.sizes, args.influences, args.directory, args.skip_eval)
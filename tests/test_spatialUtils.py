@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from GZ_utils import spatialUtils as spu
+
+
+def randomMesh(seed=0, size=12):
+    '''Return (points, triangles) of a bumpy grid with jittered points.'''
+    random = np.random.RandomState(seed)
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, size), np.linspace(0.0, 1.0, size))
+    points = np.stack([u.ravel(), v.ravel(), 0.2 * np.sin(u.ravel() * 5.0) * np.cos(v.ravel() * 3.0)], axis=1)
+    points += random.uniform(-0.02, 0.02, points.shape)
+    quads = np.arange(size * size).reshape(size, size)[:-1, :-1].ravel()
+    triangles = np.concatenate([np.stack([quads, quads + 1, quads + size + 1], axis=1),
+                                np.stack([quads, quads + size + 1, quads + size], axis=1)])
+    return points, triangles
+
+
+class TriangulateTest(unittest.TestCase):
+
+    def test_fanTriangulatesPolygons(self):
+        triangles = spu.triangulate([3, 4, 5], [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11])
+        np.testing.assert_array_equal(triangles, [[0, 1, 2],
+                                                  [3, 4, 5], [3, 5, 6],
+                                                  [7, 8, 9], [7, 9, 10], [7, 10, 11]])
+
+
+class TriangleIndexTest(unittest.TestCase):
+
+    def test_closestMatchesBruteForce(self):
+        points, triangles = randomMesh()
+        queries = np.random.RandomState(1).uniform([-0.3, -0.3, -0.5], [1.3, 1.3, 0.5], (300, 3))
+        triangleIds, bary, sqDist = spu.TriangleIndex(points, triangles, leafSize=4).closest(queries)
+
+        corners = points[triangles]
+        pairs = np.repeat(queries, len(triangles), axis=0)
+        tiled = [ np.tile(corners[:, k], (len(queries), 1)) for k in range(3) ]
+        bruteForce = spu.closestPointOnTriangles(pairs, *tiled)[2].reshape(len(queries), len(triangles)).min(axis=1)
+        np.testing.assert_allclose(sqDist, bruteForce, rtol=1e-9, atol=1e-12)
+
+        closest = (bary[:, :, None] * corners[triangleIds]).sum(axis=1)
+        np.testing.assert_allclose(((queries - closest) ** 2).sum(axis=1), sqDist, rtol=1e-9, atol=1e-12)
+
+    def test_barycentricWeightsAreConvex(self):
+        points, triangles = randomMesh(2)
+        queries = np.random.RandomState(3).uniform(-1.0, 2.0, (500, 3))
+        bary = spu.TriangleIndex(points, triangles).closest(queries)[1]
+        self.assertTrue(np.all(bary >= -1e-12))
+        np.testing.assert_allclose(bary.sum(axis=1), 1.0, atol=1e-12)
+
+    def test_interpolateKnownTriangle(self):
+        points = np.array([[0.0, 0.0, 0.0], [2.0, 0.0, 0.0], [0.0, 2.0, 0.0]])
+        index = spu.TriangleIndex(points, [[0, 1, 2]])
+        triangleIds, bary, sqDist = index.closest([[0.5, 0.5, 3.0]])
+        np.testing.assert_allclose(bary, [[0.5, 0.25, 0.25]])
+        np.testing.assert_allclose(sqDist, [9.0])
+
+        values = np.array([[1.0, 10.0], [3.0, 20.0], [5.0, 40.0]])
+        np.testing.assert_allclose(index.interpolate(values, triangleIds, bary), [[2.5, 20.0]])
+        np.testing.assert_allclose(index.interpolate(points, triangleIds, bary), [[0.5, 0.5, 0.0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
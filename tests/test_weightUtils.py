@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+from GZ_utils import weightUtils as wtu
+
+
+class MirrorInfluenceNameTest(unittest.TestCase):
+
+    def test_swapsLeadingSide(self):
+        self.assertEqual(wtu.mirrorInfluenceName('lt_arm_jnt'), 'rt_arm_jnt')
+        self.assertEqual(wtu.mirrorInfluenceName('rt_arm_jnt'), 'lt_arm_jnt')
+
+    def test_swapsAfterNamespaceOrPath(self):
+        self.assertEqual(wtu.mirrorInfluenceName('char:lt_arm_jnt'), 'char:rt_arm_jnt')
+        self.assertEqual(wtu.mirrorInfluenceName('root|spine|rt_arm_jnt'), 'root|spine|lt_arm_jnt')
+
+    def test_keepsSideInsideName(self):
+        self.assertEqual(wtu.mirrorInfluenceName('belt_jnt'), 'belt_jnt')
+        self.assertEqual(wtu.mirrorInfluenceName('salt_rt_x'), 'salt_rt_x')
+        self.assertEqual(wtu.mirrorInfluenceName('shirt_jnt'), 'shirt_jnt')
+        self.assertEqual(wtu.mirrorInfluenceName('lt_belt_jnt'), 'rt_belt_jnt')
+
+    def test_mirrorWeightsKeepsMiddleSideColumns(self):
+        influences = ['lt_arm', 'rt_arm', 'belt_jnt', 'bert_jnt']
+        weights = np.array([[0.5, 0.0, 0.5, 0.0],
+                            [0.0, 0.0, 0.0, 1.0]])
+        result = wtu.mirrorWeights(weights, influences, [1, 0])
+        np.testing.assert_allclose(result, [[0.0, 0.0, 0.0, 1.0],
+                                            [0.0, 0.5, 0.5, 0.0]])
+
+
+if __name__ == '__main__':
+    unittest.main()